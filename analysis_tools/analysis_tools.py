@@ -1,24 +1,28 @@
 import os
-import regex as re
-import copy
 import math
+import heapq
+import tempfile
+import multiprocessing as mp
+import numpy as np
 import pandas as pd
 
-from kn_tools.basic_tools import text_to_df
-from kn_tools.rna_path_tools import get_all_paths
+from kn_tools.basic_tools import load_ucsc,ucsc_exon_arrays,read_fasta
+from kn_tools.rna_path_tools import get_all_paths,iter_all_paths,iter_df_paths,get_batch_paths,drop_non_coding
 
-def go_to_bed(rna,raw):
+def go_to_bed(rna,raw,debug=False,cache_dir=None):
     """Makes the BED Files for all possible paths and outputs to bed and bedinfo directories, will consider existing directories and enumerate, also labels with RNA Name
 
     Parameters:
         rna: (str) The name of the RNA in the name2 column
-        raw: (str) File location of UCSC data
+        raw: (str) File location of UCSC data, parsed tables are cached by load_ucsc
+        debug: (boolean) True to print the lookup table, pnodes and every path [Optional]
+        cache_dir: (str) Where load_ucsc keeps the parsed table cache, defaults to .kn_cache next to raw [Optional]
 
     Returns:
         fcount: (int) The ID of the directory
     """
-    data_df = text_to_df(raw)
-    paths = get_all_paths(rna,data_df,detail=True)
+    data_df,exons = load_ucsc(raw,cache_dir=cache_dir)
+    paths = iter_all_paths(rna,data_df,detail=True,debug=debug)
     ostrich = ''
     realinfo = ''
     ncount = 1
@@ -69,6 +73,147 @@ def go_to_bed(rna,raw):
 
     return fcount
 
+def bed12_line(name,path):
+    """Converts one detailed path from get_all_paths into a BED12 line, thickStart/thickEnd are the cds of a known transcript and collapse to the start for a novel path
+
+    Parameters:
+        name: (str) The name of the BED12 feature
+        path: (list) A path from get_all_paths with detail=True
+
+    Returns:
+        line: (str) The tab separated BED12 line, with a newline
+    """
+    strand = path[1]
+    chrom = path[2]
+    if path[3] != ' ':
+        exons = path[4:-2]
+    else:
+        exons = path[4:]
+    exons = sorted([int(exon[0]),int(exon[1])] for exon in exons)
+    start = exons[0][0]
+    end = exons[-1][1]
+    if path[3] != ' ':
+        thick = map(int,path[-2:])
+    else:
+        thick = [start,start]
+    sizes = ','.join([str(e - s) for s,e in exons]) + ','
+    offsets = ','.join([str(s - start) for s,e in exons]) + ','
+    info = [chrom,str(start),str(end),name,'0',strand,str(thick[0]),str(thick[1]),'0',str(len(exons)),sizes,offsets]
+    return '\t'.join(info) + '\n'
+
+def bed_key(line):
+    """Gets the chrom and start sort key of a BED line
+
+    Parameters:
+        line: (str) A tab separated BED line
+
+    Returns:
+        key: (tuple) (chrom, start)
+    """
+    chrom,start = line.split('\t',2)[:2]
+    return (chrom,int(start))
+
+def sort_bed(fname,run=100000):
+    """Sorts a BED file in place by chrom and start with bounded memory, sorted runs of lines go to temporary files which are then merged
+
+    Parameters:
+        fname: (str) Location of the BED file
+        run: (int) Number of lines sorted in memory at a time [Optional]
+    """
+    tmpdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(fname)))
+    runs = []
+    try:
+        with open(fname,'r') as f:
+            while True:
+                lines = [line for _,line in zip(range(run),f)]
+                if len(lines) == 0:
+                    break
+                lines.sort(key=bed_key)
+                runs.append(os.path.join(tmpdir,str(len(runs))))
+                with open(runs[-1],'w') as r:
+                    r.write(''.join(lines))
+        files = [open(r,'r') for r in runs]
+        try:
+            with open(fname,'w') as f:
+                for _,line in heapq.merge(*[((bed_key(line),line) for line in r) for r in files]):
+                    f.write(line)
+        finally:
+            for r in files:
+                r.close()
+    finally:
+        for r in runs:
+            os.remove(r)
+        os.rmdir(tmpdir)
+
+def go_to_bed12(rnas,raw,fname,info=None,index=False,max_paths=None,processes=1,chunksize=1,flush=1000,debug=False,cache_dir=None):
+    """Writes the paths of one or many RNAs into a single BED12 file with one sidecar TSV for the known transcript info, instead of one file per path like go_to_bed
+
+    Parameters:
+        rnas: (list of str) The names in the name2 column, a single str, or None for every gene in the file
+        raw: (str) File location of UCSC data, parsed tables are cached by load_ucsc
+        fname: (str) Location of the BED12 file
+        info: (str) Location of the sidecar TSV, defaults to fname + '.info.tsv' [Optional]
+        index: (boolean) True to sort (with sort_bed, in bounded memory), bgzip and tabix index the BED12 file, needs pysam, the file is then replaced by fname + '.gz' and its index fname + '.gz.tbi' [Optional]
+        max_paths: (int) Only produce this many paths per gene, the best ranked by get_top_paths [Optional]
+        processes: (int) Number of worker processes for get_batch_paths, 1 streams paths in this process [Optional]
+        chunksize: (int) Number of genes sent to a worker at a time [Optional]
+        flush: (int) Number of paths buffered between writes [Optional]
+        debug: (boolean) True to print the lookup table, pnodes and every path, only used when processes is 1 [Optional]
+        cache_dir: (str) Where load_ucsc keeps the parsed table cache, defaults to .kn_cache next to raw [Optional]
+
+    Returns:
+        count: (int) The number of paths written, to fname or with index to fname + '.gz'
+    """
+    if index:
+        try:
+            import pysam
+        except ImportError:
+            raise ImportError('pysam is needed to bgzip and tabix index the BED12 file')
+    if info == None:
+        info = fname + '.info.tsv'
+    if isinstance(rnas,str):
+        rnas = [rnas]
+
+    data_df,exons = load_ucsc(raw,cache_dir=cache_dir)
+    if processes == 1:
+        if rnas is not None:
+            data_df = data_df[data_df['name2'].isin(rnas)]
+        genes = ((rna,iter_df_paths(rna,drop_non_coding(temp_df),detail=True,max_paths=max_paths,debug=debug))
+                 for rna,temp_df in data_df.groupby('name2',sort=False,observed=True))
+    else:
+        genes = get_batch_paths(data_df,rnas=rnas,detail=True,max_paths=max_paths,processes=processes,chunksize=chunksize)
+
+    count = 0
+    bed_buf = []
+    info_buf = []
+    with open(fname,'w') as f,open(info,'w') as f1:
+        f1.write('\t'.join(['name','name2','strand','chrom','realName','cdsStart','cdsEnd']) + '\n')
+        for rna,paths in genes:
+            ncount = 1
+            for path in paths or []:
+                name = rna + '_' + str(ncount)
+                ncount += 1
+                bed_buf.append(bed12_line(name,path))
+                if path[3] != ' ':
+                    real = [path[3]] + map(str,map(int,path[-2:]))
+                else:
+                    real = ['','','']
+                info_buf.append('\t'.join([name,rna,path[1],path[2]] + real) + '\n')
+                count += 1
+                if len(bed_buf) >= flush:
+                    f.write(''.join(bed_buf))
+                    f1.write(''.join(info_buf))
+                    bed_buf = []
+                    info_buf = []
+        f.write(''.join(bed_buf))
+        f1.write(''.join(info_buf))
+
+    if index:
+        sort_bed(fname)
+        #writes fname + '.gz' and fname + '.gz.tbi', removing fname
+        pysam.tabix_index(fname,preset='bed',force=True)
+    return count
+
 def seq_index(ind,nodes,strand):
     """Convert ind from genomic to sequence coordinates based on nodes and strand
     
@@ -137,41 +282,311 @@ def gene_index(ind,nodes,strand):
 
 
 
+def seq_index_array(inds,nodes,strand,invalid=-1):
+    """Array version of seq_index, converts many genomic coordinates at once with a prefix sum of exon lengths and a binary search
+
+    Parameters:
+        inds: (list of int) The genomic coordinates, any array like
+        nodes: (list of int) The genomic coordinates of the exons start/ends
+        strand: (str) + or - depending on the transcript
+        invalid: (int) Value given to coordinates that are not in an exon [Optional]
+
+    Returns:
+        to_return: (numpy array of int) The sequence coordinates
+    """
+    inds = np.asarray(inds).astype(np.int64)
+    nodes = np.asarray(nodes).astype(np.int64)
+    starts = nodes[0::2]
+    ends = nodes[1::2]
+    lens = ends - starts
+    n = len(starts)
+    if n == 0:
+        return np.full(inds.shape,invalid,dtype=np.int64)
+
+    if strand == '+':
+        #first exon ending at or after ind, measured from the start of the transcript
+        j = np.searchsorted(ends,inds,side='left')
+        jc = np.minimum(j,n - 1)
+        before = np.concatenate([[0],np.cumsum(lens)])[jc]
+        to_return = before + inds - starts[jc]
+        valid = (j < n) & (starts[jc] <= inds)
+    else:
+        #last exon starting at or before ind, measured from the end of the transcript
+        j = np.searchsorted(starts,inds,side='right') - 1
+        jc = np.maximum(j,0)
+        after = np.concatenate([np.cumsum(lens[::-1])[::-1][1:],[0]])[jc]
+        to_return = after + ends[jc] - inds
+        valid = (j >= 0) & (ends[jc] >= inds)
+    return np.where(valid,to_return,invalid)
+
+def gene_index_array(inds,nodes,strand,invalid=-1):
+    """Array version of gene_index, converts many sequence coordinates at once with a prefix sum of exon lengths and a binary search
+
+    Parameters:
+        inds: (list of int) The sequence coordinates, any array like
+        nodes: (list of int) The genomic coordinates of the exons start/ends
+        strand: (str) + or - depending on the transcript
+        invalid: (int) Value given to coordinates past the end of the transcript [Optional]
+
+    Returns:
+        to_return: (numpy array of int) The genomic coordinates
+    """
+    inds = np.asarray(inds).astype(np.int64)
+    nodes = np.asarray(nodes).astype(np.int64)
+    starts = nodes[0::2]
+    ends = nodes[1::2]
+    lens = ends - starts
+    n = len(starts)
+    if n == 0:
+        return np.full(inds.shape,invalid,dtype=np.int64)
+
+    if strand == '+':
+        total = np.cumsum(lens)
+        j = np.searchsorted(total,inds,side='left')
+        jc = np.minimum(j,n - 1)
+        to_return = inds - (total[jc] - lens[jc]) + starts[jc]
+    else:
+        total = np.cumsum(lens[::-1])
+        j = np.searchsorted(total,inds,side='left')
+        jc = np.minimum(j,n - 1)
+        to_return = ends[::-1][jc] - (inds - (total[jc] - lens[::-1][jc]))
+    return np.where(j < n,to_return,invalid)
+
+class TranscriptCoordinateIndex(object):
+    """Genome to transcript coordinate index over many transcripts, keeps the exons of all transcripts in flat arrays with their cumulative lengths so repeated seq_index and gene_index style queries only cost a binary search
+
+    Parameters:
+        starts: (numpy array of int) Exon starts of all transcripts, ascending within each transcript
+        ends: (numpy array of int) Exon ends of all transcripts, ascending within each transcript
+        offsets: (numpy array of int) Exons of transcript k are starts[offsets[k]:offsets[k+1]]
+        strands: (list of str) + or - for each transcript
+        names: (list of str) Name of each transcript, for get_ids [Optional]
+    """
+    def __init__(self,starts,ends,offsets,strands,names=None):
+        self.starts = np.asarray(starts,dtype=np.int64)
+        self.ends = np.asarray(ends,dtype=np.int64)
+        self.offsets = np.asarray(offsets,dtype=np.int64)
+        self.minus = np.asarray(strands) == '-'
+        self.names = pd.Index(names if names is not None else range(len(self.offsets) - 1))
+
+        #cum[j] is the length of all exons before exon j, across transcripts
+        self.cum = np.concatenate([[0],np.cumsum(self.ends - self.starts)])
+
+        #shift every transcript past the previous one so a single searchsorted stays inside a transcript
+        tx = np.repeat(np.arange(len(self.offsets) - 1),np.diff(self.offsets))
+        low = min(self.starts.min(),0) if len(self.starts) > 0 else 0
+        self.span = (self.ends.max() - low + 1) if len(self.ends) > 0 else 1
+        self.low = low
+        self.key_starts = tx*self.span + self.starts - low
+        self.key_ends = tx*self.span + self.ends - low
+
+    @classmethod
+    def from_ucsc(cls,df):
+        """Builds the index from a UCSC DataFrame, one transcript per row, named by the name column
+
+        Parameters:
+            df: (Pandas DataFrame) The UCSC DataFrame from ucsc_to_df or text_to_df
+
+        Returns:
+            index: (TranscriptCoordinateIndex) The index, transcript k is row k of df
+        """
+        exons = ucsc_exon_arrays(df)
+        tx = np.repeat(np.arange(len(df)),np.diff(exons['offsets']))
+        starts = exons['starts'][np.lexsort((exons['starts'],tx))]
+        ends = exons['ends'][np.lexsort((exons['ends'],tx))]
+        return cls(starts,ends,exons['offsets'],np.asarray(df['strand']).astype(str),list(df['name']))
+
+    @classmethod
+    def from_pexons(cls,strand_nodes,lu_df,strand,names=None):
+        """Builds the index from the pseudoexon paths of get_pexons or get_all_paths
+
+        Parameters:
+            strand_nodes: (list) The pseudoexon lists, as produced by get_pexons
+            lu_df: (Pandas DataFrame) The second lookup table from get_lookup2
+            strand: (str) + or - for the gene
+            names: (list of str) Name of each transcript, like the names from get_pexons [Optional]
+
+        Returns:
+            index: (TranscriptCoordinateIndex) The index, transcript k is strand_nodes[k]
+        """
+        counts = [len(nodes) for nodes in strand_nodes]
+        pex = np.array([int(item) for nodes in strand_nodes for item in nodes],dtype=np.int64)
+        starts = lu_df.loc[pex,'start'].values.astype(np.int64)
+        ends = lu_df.loc[pex,'end'].values.astype(np.int64)
+        offsets = np.concatenate([[0],np.cumsum(counts)]).astype(np.int64)
+        tx = np.repeat(np.arange(len(counts)),counts)
+        order = np.lexsort((starts,tx))
+        return cls(starts[order],ends[order],offsets,[strand]*len(counts),names)
+
+    def get_ids(self,names):
+        """Gets the transcript positions for transcript names
+
+        Parameters:
+            names: (list of str) The transcript names
+
+        Returns:
+            ids: (numpy array of int) The position of each transcript, -1 if it is not in the index
+        """
+        return self.names.get_indexer(names)
+
+    def to_seq(self,tx,inds,invalid=-1):
+        """Converts genomic coordinates to sequence coordinates like seq_index, for many transcripts at once
+
+        Parameters:
+            tx: (numpy array of int) Transcript position of each query, or one position for all of them
+            inds: (numpy array of int) The genomic coordinates
+            invalid: (int) Value given to coordinates that are not in an exon [Optional]
+
+        Returns:
+            to_return: (numpy array of int) The sequence coordinates
+        """
+        tx,inds = np.broadcast_arrays(np.asarray(tx,dtype=np.int64),np.asarray(inds).astype(np.int64))
+        first = self.offsets[tx]
+        last = self.offsets[tx + 1]
+        key = tx*self.span + inds - self.low
+        n = len(self.starts)
+
+        #plus strand, first exon ending at or after ind
+        jp = np.searchsorted(self.key_ends,key,side='left')
+        jpc = np.minimum(jp,n - 1)
+        plus = self.cum[jpc] - self.cum[first] + inds - self.starts[jpc]
+        ok_plus = (jp < last) & (self.starts[jpc] <= inds)
+
+        #minus strand, last exon starting at or before ind
+        jm = np.searchsorted(self.key_starts,key,side='right') - 1
+        jmc = np.maximum(jm,0)
+        minus = self.cum[last] - self.cum[jmc + 1] + self.ends[jmc] - inds
+        ok_minus = (jm >= first) & (self.ends[jmc] >= inds)
+
+        is_minus = self.minus[tx]
+        to_return = np.where(is_minus,minus,plus)
+        valid = np.where(is_minus,ok_minus,ok_plus) & (last > first)
+        return np.where(valid,to_return,invalid)
+
+    def to_gene(self,tx,inds,invalid=-1):
+        """Converts sequence coordinates to genomic coordinates like gene_index, for many transcripts at once
+
+        Parameters:
+            tx: (numpy array of int) Transcript position of each query, or one position for all of them
+            inds: (numpy array of int) The sequence coordinates
+            invalid: (int) Value given to coordinates past the end of the transcript [Optional]
+
+        Returns:
+            to_return: (numpy array of int) The genomic coordinates
+        """
+        tx,inds = np.broadcast_arrays(np.asarray(tx,dtype=np.int64),np.asarray(inds).astype(np.int64))
+        first = self.offsets[tx]
+        last = self.offsets[tx + 1]
+        n = len(self.starts)
+
+        #plus strand, first exon whose running length reaches ind
+        jp = np.maximum(np.searchsorted(self.cum[1:],inds + self.cum[first],side='left'),first)
+        jpc = np.minimum(jp,n - 1)
+        plus = inds - (self.cum[jpc] - self.cum[first]) + self.starts[jpc]
+        ok_plus = jp < last
+
+        #minus strand, same from the last exon backwards
+        jm = np.minimum(np.searchsorted(self.cum[:-1],self.cum[last] - inds,side='right') - 1,last - 1)
+        jmc = np.clip(jm,0,n - 1)
+        minus = self.ends[jmc] - (inds - (self.cum[last] - self.cum[jmc + 1]))
+        ok_minus = jm >= first
+
+        is_minus = self.minus[tx]
+        to_return = np.where(is_minus,minus,plus)
+        valid = np.where(is_minus,ok_minus,ok_plus) & (last > first)
+        return np.where(valid,to_return,invalid)
+
 def fetch_coords(seq):
-    """Gets the location of the start and stop codon
+    """Gets the location of the start and stop codon, the longest ORF from an ATG to its first in frame stop, found with a single scan of each of the three frames
 
     Parameters:
         seq: (str) The string of A,T,G,C from the bed file
 
     Returns:
-        se: (list of 2 int) first value is the start, second value is the stop
+        se: (list of 2 int) first value is the start, second value is the stop, None if there is no ORF
     """
-    matches = list(re.finditer('(ATG)(...)*?(TAG|TAA|TGA).*?',seq,overlapped=True))
-    
-    pairs = []
-    
-    starts = sorted(list(set([item.span(1)[0] for item in matches])))
-    stops = sorted(list(set([item.span(3)[1] for item in matches])))
-    
-    temp_i = []
-    temp_j = []
-    temp_diffs = []
-    
-    for i in range(len(starts)):
-        mod = starts[i] % 3
-        
-        j = 0
-        while j >= 0 and j < len(stops):
-            if stops[j] > starts[i]:
-                if stops[j] % 3 == mod:
-                    temp_i.append(i)
-                    temp_j.append(j)
-                    temp_diffs.append(stops[j]-starts[i])
-                    j = len(stops) + 1
-            j += 1
-    
-    ind = temp_diffs.index(max(temp_diffs))
-    se = [starts[temp_i[ind]],stops[temp_j[ind]]]
+    stops = set(['TAG','TAA','TGA'])
+    se = None
+    for frame in range(3):
+        open_start = -1
+        for i in range(frame,len(seq) - 2,3):
+            codon = seq[i:i+3]
+            if codon == 'ATG':
+                if open_start == -1:
+                    open_start = i
+            elif codon in stops:
+                if open_start != -1:
+                    #longer wins, ties go to the earlier start
+                    if se == None or i + 3 - open_start > se[1] - se[0] or (i + 3 - open_start == se[1] - se[0] and open_start < se[0]):
+                        se = [open_start,i + 3]
+                    open_start = -1
+    return se
+
+def codon_lut():
+    """Makes the byte to base lookup table of codon_codes, A,C,G,T are 0 to 3 and every other byte is 4
+
+    Returns:
+        lut: (numpy array of int) 256 long lookup table
+    """
+    lut = np.full(256,4,dtype=np.int64)
+    lut[[ord(base) for base in 'ACGT']] = np.arange(4)
+    return lut
+
+CODON_LUT = codon_lut()
+
+def codon_codes(seq):
+    """Encodes every 3-mer of a sequence as an int with a lookup table, 3-mers with a base other than A,C,G,T get codes of 64 and above
+
+    Parameters:
+        seq: (str) The string of A,T,G,C
+
+    Returns:
+        codes: (numpy array of int) The code of the 3-mer starting at each position, length len(seq) - 2
+    """
+    if not isinstance(seq,bytes):
+        seq = seq.encode('ascii')
+    b = CODON_LUT[np.frombuffer(seq,dtype=np.uint8)]
+    if len(b) < 3:
+        return np.zeros(0,dtype=np.int64)
+    bad = (b[:-2] == 4) | (b[1:-1] == 4) | (b[2:] == 4)
+    return np.where(bad,64,b[:-2]*16 + b[1:-1]*4 + b[2:])
+
+ATG_CODE = 0*16 + 3*4 + 2
+STOP_CODES = [3*16 + 0*4 + 2,3*16 + 0*4 + 0,3*16 + 2*4 + 0]
+
+def fetch_coords_array(seqs):
+    """NumPy version of fetch_coords for a batch of sequences, codons are looked up as arrays and each stop is paired with the first ATG after the previous in frame stop
+
+    Parameters:
+        seqs: (list of str) The sequences
+
+    Returns:
+        se: (numpy array of int) One [start, stop] row per sequence like fetch_coords, [-1, -1] if there is no ORF
+    """
+    se = np.full((len(seqs),2),-1,dtype=np.int64)
+    for k,seq in enumerate(seqs):
+        codes = codon_codes(seq)
+        best_len = 0
+        for frame in range(3):
+            c = codes[frame::3]
+            is_stop = np.in1d(c,STOP_CODES)
+            #codons between two stops share a segment, a stop closes the segment it ends
+            seg = np.cumsum(is_stop) - is_stop
+            atg = np.flatnonzero(c == ATG_CODE)
+            stop = np.flatnonzero(is_stop)
+            if len(atg) == 0 or len(stop) == 0:
+                continue
+            atg_seg,first = np.unique(seg[atg],return_index=True)
+            has = atg_seg < len(stop)
+            starts = atg[first[has]]*3 + frame
+            ends = stop[atg_seg[has]]*3 + frame + 3
+            if len(starts) == 0:
+                continue
+            lens = ends - starts
+            i = np.argmax(lens)
+            if lens[i] > best_len or (lens[i] == best_len and starts[i] < se[k,0]):
+                best_len = lens[i]
+                se[k] = [starts[i],ends[i]]
     return se
 
 def set_flags(ss_df):
@@ -181,39 +596,199 @@ def set_flags(ss_df):
         ss_df: (Pandas DataFrame) The outputted DataFrame from startstop.py with the added columns 'exonsFromEnd', 'basesFromJunct', 'exists', 'theorized_nmd', 'erroneous_nmd' if in last exon, 'basesFromJunct' is -1, 'exists', 'theorized_nmd', 'erroneous_nmd' are 0 and 1 boolean value
     
     Returns:
-        new_df: (Pandas DataFrame) ss_df updated with the aforementioned data
+        new_df: (Pandas DataFrame) ss_df updated with the aforementioned data, 'basesFromJunct' is NaN if the stop is in no exon
     """
-    new_df = copy.deepcopy(ss_df)
-    for index,row in new_df.iterrows():
-        seq_nodes = sorted(map(int,str(row.get_value('seqNodes')).split(',')))
-        
-        end = int(row.get_value('regexStop'))
-        i1 = len(seq_nodes) - 1
-        i2 = 0
-        s = -2
-        
-        junct = i1+s/2
-        dist = ''
-        excount = 0
+    #all seqNodes in one flat array, sorted within each row
+    nodes_str = ss_df['seqNodes'].astype(str)
+    counts = nodes_str.str.count(',').values + 1
+    nodes = np.fromstring(','.join(nodes_str.values),dtype=np.int64,sep=',')
+    row = np.repeat(np.arange(len(ss_df)),counts)
+    nodes = nodes[np.lexsort((nodes,row))]
+    excount,dist = nmd_flags_array(nodes,counts,ss_df['regexStop'].values.astype(np.int64))
+    found = ~np.isnan(dist)
+    theorized = (dist >= 50).astype(np.int64)
+    
+    new_df = ss_df.copy()
+    new_df['exonsFromEnd'] = excount
+    new_df['basesFromJunct'] = dist if not found.all() else dist.astype(np.int64)
+    new_df['theorized_nmd'] = theorized
+    new_df['erroneous_nmd'] = (ss_df['exists'].values.astype(np.int64) + theorized + 1) % 2
+    return new_df
 
-        for i in range(i1,i2,s):
-            ex_test = sorted([seq_nodes[i],seq_nodes[i + s/2]])
-            
-            # If the sequence coordinates of the end lie in the sequence exon of the ends exon
-            if ex_test[0] < end and end <= ex_test[1]:
-                dist = abs(seq_nodes[junct] - end)
-                if excount == 0:
-                    dist = -1
-                break
-            excount += 1
-        
-        new_df.loc[index,'exonsFromEnd'] = excount
-        new_df.loc[index,'basesFromJunct'] = dist
+def nmd_flags_array(nodes,counts,end):
+    """Gets the exons from end and bases from the last junction for many stops at once, used by set_flags and nmd_flags
+    
+    Parameters:
+        nodes: (numpy array of int) The sequence coordinates of the exon start/ends of every row in one flat array, sorted within each row
+        counts: (numpy array of int) The number of nodes in each row
+        end: (numpy array of int) The sequence coordinate of the end of the stop codon in each row
+    
+    Returns:
+        excount: (numpy array of int) Number of exons between the stop and the end
+        dist: (numpy array of float) Bases from the stop to the last junction, -1 if the stop is in the last exon, NaN if it is in no exon
+    """
+    counts = np.asarray(counts,dtype=np.int64)
+    offsets = np.concatenate([[0],np.cumsum(counts)])
+    row = np.repeat(np.arange(len(counts)),counts)
+    
+    #every exon is a pair (i-1,i) counted back from the last node, find the last one holding the stop
+    local = np.arange(len(nodes)) - offsets[row]
+    size = counts[row]
+    right = np.flatnonzero((local >= 1) & ((size - 1 - local) % 2 == 0))
+    hit = right[(nodes[right - 1] < end[row[right]]) & (end[row[right]] <= nodes[right])]
+    best = np.full(len(counts),-1,dtype=np.int64)
+    np.maximum.at(best,row[hit],local[hit])
+    
+    found = best >= 0
+    excount = np.where(found,(counts - 1 - best)//2,counts//2)
+    junct = nodes[np.maximum(offsets[:-1] + counts - 2,0)] if len(nodes) > 0 else np.zeros(len(counts),dtype=np.int64)
+    dist = np.where(excount == 0,-1,np.abs(junct - end))
+    return excount,np.where(found,dist,np.nan)
 
-        if row.get_value('basesFromJunct') >= 50:
-            new_df.loc[index,'theorized_nmd'] = 1
-        new_df.loc[index,'erroneous_nmd'] = (row.get_value('exists') + row.get_value('theorized_nmd') + 1) % 2
-    return new_df
+def nmd_flags(seq_nodes,end):
+    """Gets the exons from end and bases from the last junction for one stop, the single row case of nmd_flags_array
+
+    Parameters:
+        seq_nodes: (list of int) The sequence coordinates of the exon start/ends
+        end: (int) The sequence coordinate of the end of the stop codon
+
+    Returns:
+        excount: (int) Number of exons between the stop and the end
+        dist: (int) Bases from the stop to the last junction, -1 if the stop is in the last exon, NaN if it is in no exon
+    """
+    excount,dist = nmd_flags_array(np.sort(np.asarray(seq_nodes,dtype=np.int64)),[len(seq_nodes)],np.array([end],dtype=np.int64))
+    return int(excount[0]),(np.nan if np.isnan(dist[0]) else int(dist[0]))
+
+def read_bed12(fname,info=None):
+    """Reads the BED12 file and sidecar TSV written by go_to_bed12 into the exon nodes of each path
+
+    Parameters:
+        fname: (str) Location of the BED12 file
+        info: (str) Location of the sidecar TSV, defaults to fname + '.info.tsv' when that exists [Optional]
+
+    Returns:
+        paths: (dictionary) name to (chrom, strand, nodes, exists), nodes are the genomic exon start/ends and exists is 1 for a known transcript
+    """
+    known = set()
+    if info == None and os.path.exists(fname + '.info.tsv'):
+        info = fname + '.info.tsv'
+    if info != None:
+        with open(info,'r') as f:
+            f.readline()
+            for line in f:
+                cols = line.rstrip('\n').split('\t')
+                if len(cols) > 4 and cols[4] != '':
+                    known.add(cols[0])
+
+    paths = {}
+    with open(fname,'r') as f:
+        for line in f:
+            cols = line.rstrip('\n').split('\t')
+            start = int(cols[1])
+            sizes = map(int,cols[10].rstrip(',').split(','))
+            offsets = map(int,cols[11].rstrip(',').split(','))
+            nodes = []
+            for size,offset in zip(sizes,offsets):
+                nodes += [start + offset,start + offset + size]
+            paths[cols[3]] = (cols[0],cols[5],nodes,int(cols[3] in known))
+    return paths
+
+ORF_COLUMNS = ['name','chrom','strand','seqLen','regexStart','regexStop','genomicStart','genomicStop','seqNodes',
+               'exists','exonsFromEnd','basesFromJunct','theorized_nmd','erroneous_nmd']
+
+def annotate_orf(job):
+    """Finds the ORF of one path sequence and its NMD flags, worker for annotate_orfs
+
+    Parameters:
+        job: (tuple) (name, seq, chrom, strand, nodes, exists) with nodes the genomic exon start/ends of the path
+
+    Returns:
+        row: (list) The values for ORF_COLUMNS, -1 for the ORF columns if there is no ORF, basesFromJunct is NaN like in set_flags if the stop is in no exon
+    """
+    name,seq,chrom,strand,nodes,exists = job
+    lens = [nodes[i+1] - nodes[i] for i in range(0,len(nodes),2)]
+    if strand == '-':
+        lens.reverse()
+    seq_nodes = []
+    total = 0
+    for l in lens:
+        seq_nodes += [total,total + l]
+        total += l
+
+    if len(seq) != total:
+        #bedtools getfasta without -split gives the whole genomic span, whose coordinates do not fit the exons
+        raise ValueError('%s is %d bases but its exons in the BED12 add up to %d, was getfasta run with -split?' % (name,len(seq),total))
+
+    se = fetch_coords(seq.upper())
+    if se == None:
+        return [name,chrom,strand,len(seq),-1,-1,-1,-1,','.join(map(str,seq_nodes)),exists,-1,-1,-1,-1]
+
+    g_start = gene_index(se[0],nodes,strand)
+    g_stop = gene_index(se[1],nodes,strand)
+    excount,dist = nmd_flags(seq_nodes,se[1])
+    theorized = int(dist >= 50)
+    erroneous = (exists + theorized + 1) % 2
+    return [name,chrom,strand,len(seq),se[0],se[1],g_start,g_stop,','.join(map(str,seq_nodes)),exists,excount,dist,theorized,erroneous]
+
+def annotate_orfs(seqs,bed12,out,info=None,processes=None,chunksize=100,flush=1000):
+    """Finds the ORF, genomic start/stop and NMD flags for every path sequence and streams the rows to a TSV, sequences can come from bedtools getfasta -split -s -name on the go_to_bed12 output
+
+    Parameters:
+        seqs: (str) Location of a FASTA file, or an iterator of (name, seq), names are checked against bed12 before any work is sent to the workers
+        bed12: (str) Location of the BED12 file from go_to_bed12, for the exon structure of each path
+        out: (str) Location of the output TSV, with the ORF_COLUMNS header
+        info: (str) Location of the go_to_bed12 sidecar TSV, for the exists column [Optional]
+        processes: (int) Number of worker processes, defaults to the cpu count, 1 runs in this process [Optional]
+        chunksize: (int) Number of sequences sent to a worker at a time [Optional]
+        flush: (int) Number of rows buffered between writes, also the number of sequences handed to the pool at a time [Optional]
+
+    Returns:
+        count: (int) The number of sequences annotated
+    """
+    paths = read_bed12(bed12,info)
+    if isinstance(seqs,basestring):
+        seqs = read_fasta(seqs)
+
+    def batches():
+        #names are resolved here in the calling process, so an unknown name raises the same way for any number of processes
+        batch = []
+        for name,seq in seqs:
+            #bedtools appends ::chrom:start-end(strand) to the name
+            key = name.split('::')[0].split()[0]
+            if not key in paths:
+                raise KeyError(key + ' is not in ' + bed12)
+            chrom,strand,nodes,exists = paths[key]
+            batch.append((key,seq,chrom,strand,nodes,exists))
+            if len(batch) >= flush:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+    if processes == 1:
+        pool = None
+        rows = (annotate_orf(job) for batch in batches() for job in batch)
+    else:
+        pool = mp.Pool(processes)
+        rows = (row for batch in batches() for row in pool.imap(annotate_orf,batch,chunksize))
+
+    count = 0
+    buf = []
+    try:
+        with open(out,'w') as f:
+            f.write('\t'.join(ORF_COLUMNS) + '\n')
+            for row in rows:
+                buf.append('\t'.join(map(str,row)) + '\n')
+                count += 1
+                if len(buf) >= flush:
+                    f.write(''.join(buf))
+                    buf = []
+            f.write(''.join(buf))
+    finally:
+        if pool != None:
+            pool.terminate()
+            pool.join()
+    return count
 
 def entropy(x):
     """Gets the entropy for a list of boolean
@@ -261,6 +836,176 @@ def mutual_inf(pairs):
     MI = H_x + H_y - H_xy
     return MI,detailed
 
+def get_inclusion(strand_nodes,pexons=None):
+    """Gets the transcripts by pseudoexons 0/1 inclusion matrix from the pseudoexon lists of get_pexons
+
+    Parameters:
+        strand_nodes: (list) The pseudoexon lists, as produced by get_pexons
+        pexons: (list of int) The pseudoexons to use as columns, defaults to every pseudoexon used [Optional]
+
+    Returns:
+        X: (numpy array of int) 1 where the transcript of the row includes the pseudoexon of the column
+        pexons: (list of int) The pseudoexon of each column
+    """
+    if pexons is None:
+        pexons = sorted(set(item for nodes in strand_nodes for item in nodes))
+    col = dict((p,i) for i,p in enumerate(pexons))
+    X = np.zeros((len(strand_nodes),len(pexons)),dtype=np.int8)
+    for r,nodes in enumerate(strand_nodes):
+        X[r,[col[item] for item in nodes if item in col]] = 1
+    return X,pexons
+
+def entropy_terms(counts,t):
+    """Gets -p*log2(p) for an array of counts out of t, 0 where the count is 0
+
+    Parameters:
+        counts: (numpy array of int) The counts
+        t: (int) The total
+
+    Returns:
+        terms: (numpy array of float) The entropy contribution of each count
+    """
+    p = np.asarray(counts,dtype=np.float64)/t
+    with np.errstate(divide='ignore',invalid='ignore'):
+        terms = -p*np.log2(p)
+    return np.where(p > 0,terms,0.0)
+
+def mutual_inf_counts(X,Y):
+    """Gets the contingency counts between every column of X and every column of Y with matrix products
+
+    Parameters:
+        X: (numpy array of float) Transcripts by exons 0/1 inclusion matrix
+        Y: (numpy array of float) Transcripts by exons 0/1 inclusion matrix with the same rows, may be stacked as (batch, transcripts, exons)
+
+    Returns:
+        counts: (dictionary) Count matrix for each pairing (0,0), (1,1), (0,1), (1,0), X columns by Y columns
+    """
+    t = X.shape[0]
+    c11 = np.matmul(X.T,Y)
+    c10 = X.sum(axis=0)[:,None] - c11
+    c01 = Y.sum(axis=-2)[...,None,:] - c11
+    c00 = t - c11 - c10 - c01
+    return {(0,0): c00,(0,1): c01,(1,0): c10,(1,1): c11}
+
+def mutual_inf_from_counts(counts,t):
+    """Gets the mutual information from the contingency counts of mutual_inf_counts
+
+    Parameters:
+        counts: (dictionary) Count matrix for each pairing (0,0), (1,1), (0,1), (1,0)
+        t: (int) The number of transcripts
+
+    Returns:
+        MI: (numpy array of float) The mutual information for each count
+    """
+    H_x = entropy_terms(counts[(1,0)] + counts[(1,1)],t) + entropy_terms(counts[(0,0)] + counts[(0,1)],t)
+    H_y = entropy_terms(counts[(0,1)] + counts[(1,1)],t) + entropy_terms(counts[(0,0)] + counts[(1,0)],t)
+    H_xy = entropy_terms(counts[(0,0)],t) + entropy_terms(counts[(0,1)],t) + entropy_terms(counts[(1,0)],t) + entropy_terms(counts[(1,1)],t)
+    return H_x + H_y - H_xy
+
+def mutual_inf_matrix(X,detailed=False,top_k=None):
+    """Gets the mutual information of every pair of columns of a 0/1 inclusion matrix with matrix products, the same I(X,Y) = H(X) + H(Y) - H(X,Y) as mutual_inf
+
+    Parameters:
+        X: (numpy array of int) Transcripts by exons 0/1 inclusion matrix, from get_inclusion
+        detailed: (boolean) True to also return the contingency counts [Optional]
+        top_k: (int) Return only the k pairs of different columns with the highest MI [Optional]
+
+    Returns:
+        MI: (numpy array of float) Exons by exons MI matrix, or if top_k is given a list of (i, j, MI) with i < j from the highest MI down
+        detailed: (dictionary) Only if detailed, exons by exons count matrix for each pairing (0,0), (1,1), (0,1), (1,0)
+    """
+    X = np.asarray(X,dtype=np.float64)
+    counts = mutual_inf_counts(X,X)
+    MI = mutual_inf_from_counts(counts,X.shape[0])
+
+    if top_k is not None:
+        i,j = np.triu_indices(X.shape[1],1)
+        order = np.argsort(-MI[i,j],kind='mergesort')[:top_k]
+        MI = [(int(i[k]),int(j[k]),MI[i[k],j[k]]) for k in order]
+    if detailed:
+        return MI,dict((key,c.astype(np.int64)) for key,c in counts.items())
+    return MI
+
+def mutual_inf_null(job):
+    """Runs one block of label permutations for mutual_inf_perm, worker for the process pool
+
+    Parameters:
+        job: (tuple) (X, observed MI matrix, seed, block number, number of permutations in the block)
+
+    Returns:
+        exceed: (numpy array of int) Exons by exons count of permutations with an MI at least the observed one
+    """
+    X,MI,seed,block,n = job
+    rs = np.random.RandomState([seed,block])
+    t = X.shape[0]
+    #every permutation shuffles the rows of a copy of X, breaking each pair while keeping the column counts
+    perms = np.array([rs.permutation(t) for k in range(n)])
+    Y = X[perms]
+    null = mutual_inf_from_counts(mutual_inf_counts(X,Y),t)
+    return (null >= MI[None,:,:] - 1e-12).sum(axis=0)
+
+def bh_adjust(p):
+    """Benjamini-Hochberg FDR adjustment
+
+    Parameters:
+        p: (numpy array of float) The p-values
+
+    Returns:
+        q: (numpy array of float) The q-values, in the same order
+    """
+    p = np.asarray(p,dtype=np.float64)
+    n = len(p)
+    if n == 0:
+        return p
+    order = np.argsort(p)
+    q = p[order]*n/np.arange(1,n + 1)
+    q = np.minimum.accumulate(q[::-1])[::-1]
+    out = np.empty(n)
+    out[order] = np.minimum(q,1.0)
+    return out
+
+def mutual_inf_perm(X,n_perm=1000,seed=0,processes=None,batch=100):
+    """Permutation test for the MI of every pair of pseudoexons, permutations are run in seeded blocks across a process pool so results do not depend on the number of processes
+
+    Parameters:
+        X: (numpy array of int) Transcripts by exons 0/1 inclusion matrix, from get_inclusion
+        n_perm: (int) Number of permutations [Optional]
+        seed: (int) Seed for the permutations [Optional]
+        processes: (int) Number of worker processes, defaults to the cpu count, 1 runs in this process [Optional]
+        batch: (int) Number of permutations computed together in one block [Optional]
+
+    Returns:
+        MI: (numpy array of float) Exons by exons MI matrix from mutual_inf_matrix
+        p: (numpy array of float) Exons by exons permutation p-values, NaN on the diagonal
+        q: (numpy array of float) Exons by exons Benjamini-Hochberg q-values over all pairs, NaN on the diagonal
+    """
+    X = np.asarray(X,dtype=np.float64)
+    MI = mutual_inf_matrix(X)
+    sizes = [min(batch,n_perm - start) for start in range(0,n_perm,batch)]
+    jobs = [(X,MI,seed,block,n) for block,n in enumerate(sizes)]
+
+    if processes == 1:
+        results = map(mutual_inf_null,jobs)
+    else:
+        pool = mp.Pool(processes)
+        try:
+            results = pool.map(mutual_inf_null,jobs)
+        finally:
+            pool.terminate()
+            pool.join()
+    exceed = np.sum(results,axis=0)
+
+    #the pair (i,j) and (j,i) share one test, use the upper triangle for both
+    m = X.shape[1]
+    i,j = np.triu_indices(m,1)
+    p = np.full((m,m),np.nan)
+    q = np.full((m,m),np.nan)
+    p[i,j] = (exceed[i,j] + 1.0)/(n_perm + 1)
+    q[i,j] = bh_adjust(p[i,j])
+    p[j,i] = p[i,j]
+    q[j,i] = q[i,j]
+    return MI,p,q
+
 def get_splice_sites(mod_df):
     """Gets the splice site information about a mod dataframe
     
@@ -270,25 +1015,51 @@ def get_splice_sites(mod_df):
     Returns:
         ss_df: (Pandas DataFrame) Includes the unique splice site info for the rna
     """
-    ss_list = []
-    ss_set = []
+    ss_df = splice_site_rows(mod_df)
+    ss_df = ss_df.drop_duplicates(subset=['splice_site','pexon','frame','NMD_ind']).reset_index(drop=True)
+    if len(mod_df) > 0:
+        ss_df['name2'] = mod_df['name2'].iloc[-1]
+        ss_df['strand'] = mod_df['strand'].iloc[-1]
+    return ss_df
+
+def get_all_splice_sites(mod_df):
+    """Gets the splice site information about a mod dataframe covering many rna at once, unique within each name2 and strand
+    
+    Parameters:
+        mod_df: (Pandas DataFrame) The mod_df for any number of rna, must have strand and name2 columns
+    
+    Returns:
+        ss_df: (Pandas DataFrame) Includes the unique splice site info for every rna, in the order first seen
+    """
+    ss_df = splice_site_rows(mod_df)
+    return ss_df.drop_duplicates().reset_index(drop=True)
+
+def splice_site_rows(mod_df):
+    """Gets the splice site of every row of a mod dataframe, from the last pseudoexon column that is not -1, used by get_splice_sites and get_all_splice_sites
+    
+    Parameters:
+        mod_df: (Pandas DataFrame) The mod_df, must have strand and name2 columns
+    
+    Returns:
+        ss_df: (Pandas DataFrame) One row per mod_df row with a pseudoexon, duplicates included
+    """
+    columns = ['name2','strand','splice_site','pexon','frame','NMD_ind']
     exon_cols = list(mod_df.columns)[5:-1]
-    for index,row in mod_df.iterrows():
-        mods = [row.get_value(col) for col in exon_cols]
-        nmd_ind = row.get_value('NMD_ind')
-        strand = row.get_value('strand')
-        for i in range(len(mods)-1,-1,-1):
-            if mods[i] != -1:
-                if strand == '+':
-                    coord = row.get_value('cdsEnd')
-                else:
-                    coord = row.get_value('cdsStart')
-                if not (coord,exon_cols[i],mods[i],nmd_ind) in ss_set:
-                    ss_list.append([coord,exon_cols[i],mods[i],nmd_ind])
-                    ss_set.append((coord,exon_cols[i],mods[i],nmd_ind))
-                break
-    ss_df = pd.DataFrame(ss_list,columns=['splice_site','pexon','frame','NMD_ind'])
-    ss_df.insert(0,'name2',row.get_value('name2'))
-    ss_df.insert(1,'strand',row.get_value('strand'))
+    if len(exon_cols) == 0 or len(mod_df) == 0:
+        return pd.DataFrame([],columns=columns)
+    
+    mods = mod_df[exon_cols].values
+    has = mods != -1
+    last = len(exon_cols) - 1 - np.argmax(has[:,::-1],axis=1)
+    rows = np.flatnonzero(has.any(axis=1))
+    last = last[rows]
+    
+    strand = mod_df['strand'].values[rows]
+    coord = np.where(strand == '+',mod_df['cdsEnd'].values[rows],mod_df['cdsStart'].values[rows])
+    ss_df = pd.DataFrame({'name2': mod_df['name2'].values[rows],
+                          'strand': strand,
+                          'splice_site': coord,
+                          'pexon': np.array(exon_cols,dtype=object)[last],
+                          'frame': mods[rows,last],
+                          'NMD_ind': mod_df['NMD_ind'].values[rows]},columns=columns)
     return ss_df
-        
\ No newline at end of file
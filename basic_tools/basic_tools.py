@@ -1,25 +1,24 @@
+import os
+import json
+import shutil
+import tempfile
+import hashlib
 import pandas as pd
-import copy
 import numpy as np 
-from scipy.spatial.distance import euclidean
+from pandas.api.extensions import ExtensionDtype,ExtensionArray,take
 
 def filter_df(df,indexes):
     """Returns a dataframe that includes info from indicated indexes
     
     Parameters:
         df: (Pandas DataFrame) The original DataFrame
-        indexes: (list of str) The list of indexes
+        indexes: (list of str) The list of indexes, a KeyError is raised if any is not in df
     """
-    head = df.columns
-    data = []
-    for i in indexes:
-        row = []
-        for c in head:
-            row.append(df.get_value(i,c))
-        data.append(row)
-    new_df = pd.DataFrame(data,columns=head)
-    new_df.index = indexes
-    return new_df
+    indexes = list(indexes)
+    pos = df.index.get_indexer_for(indexes)
+    if (pos == -1).any():
+        raise KeyError('%s not in index' % [i for i,p in zip(indexes,pos) if p == -1])
+    return df.iloc[pos]
 
 def redact_df(df,columns):
     """Returns a dataframe that includes info from indicated columns
@@ -28,16 +27,7 @@ def redact_df(df,columns):
         df: (Pandas DataFrame) The original DataFrame
         indexes: (list of str) The list of column names
     """
-    ind = df.index
-    data = []
-    for c in columns:
-        vert = list(df[c])
-        data.append(vert)
-    new_df = pd.DataFrame(data)
-    new_df = new_df.transpose()
-    new_df.columns = columns
-    new_df.index = ind
-    return new_df
+    return df[list(columns)]
 
 def get_certain_mef(df,mef):
     """Get certain mef or columns from a df that includes cytosolic, membrane, insoluble data
@@ -51,7 +41,7 @@ def get_certain_mef(df,mef):
     return redact_df(df,cs)
 
 def exp_err_adj(c,m,i,p_c,p_m):
-    """Experimental error adjustment
+    """Experimental error adjustment, values can be floats or NumPy arrays / Pandas Series of matching shape
     
     Parameters:
         c = (float) Cytosolic experimental value
@@ -75,24 +65,42 @@ def adj_df(df,mef,p_c,p_m):
         p_c = (float) Proportion of actual cytosolic obtained, between 0 and 1
         p_m = (float) Proportion of actual membrane obtained, between 0 and 1
     """
-    return_df = copy.deepcopy(df)
-    return_df.insert(len(return_df.columns),'cyt',0)
-    return_df.insert(len(return_df.columns),'mem',0)
-    return_df.insert(len(return_df.columns),'ins',0)
     types = ['cyt','mem','ins']
     cols = [mef + '_' + t for t in types]
+    c,m,i = [df[col].astype(float) for col in cols]
+    c,m,i = exp_err_adj(c,m,i,float(p_c),float(p_m))
+    return pd.DataFrame({'cyt': c,'mem': m,'ins': i},index=df.index,columns=types)
+
+def adj_panel(df,p_c,p_m,mefs=None,tidy=False):
+    """Adjusts every MEF of a df for experimental extraction error at once
     
-    for index,row in df.iterrows():
-        c = float(row.get_value(cols[0]))
-        m = float(row.get_value(cols[1]))
-        i = float(row.get_value(cols[2]))
-        c,m,i = exp_err_adj(c,m,i,p_c,p_m)
-
-        return_df.loc[index,'cyt'] = c
-        return_df.loc[index,'mem'] = m
-        return_df.loc[index,'ins'] = i
+    Parameters:
+        df: (Pandas DataFrame) The experimentally derived DataFrame with _cyt, _mem, _ins columns for each MEF
+        p_c: (float) Proportion of actual cytosolic obtained, or a dictionary of it for each MEF
+        p_m: (float) Proportion of actual membrane obtained, or a dictionary of it for each MEF
+        mefs: (list of str) The MEF prefixes to adjust, defaults to every prefix with all three columns [Optional]
+        tidy: (boolean) True to return one row per gene and MEF instead of MultiIndex columns [Optional]
     
-    return redact_df(return_df,types)
+    Returns:
+        adj: (Pandas DataFrame) cyt, mem, ins under each MEF as (mef, type) columns, or indexed by (gene, mef) if tidy
+    """
+    types = ['cyt','mem','ins']
+    if mefs is None:
+        mefs = [col[:-4] for col in df.columns if col.endswith('_cyt') and col[:-4] + '_mem' in df.columns and col[:-4] + '_ins' in df.columns]
+    if isinstance(p_c,dict):
+        p_c = np.array([p_c[mef] for mef in mefs],dtype=np.float64)
+    if isinstance(p_m,dict):
+        p_m = np.array([p_m[mef] for mef in mefs],dtype=np.float64)
+
+    #genes by mefs arrays, p_c and p_m broadcast along the mefs
+    c,m,i = [df[[mef + '_' + t for mef in mefs]].values.astype(np.float64) for t in types]
+    adj = np.stack(exp_err_adj(c,m,i,p_c,p_m),axis=2)
+    adj = pd.DataFrame(adj.reshape(len(df),3*len(mefs)),index=df.index,
+                       columns=pd.MultiIndex.from_product([mefs,types],names=['mef','type']))
+    if tidy:
+        adj = adj.stack(level='mef')[types]
+        adj.columns.name = None
+    return adj
     
 def text_to_df(filename,index=None,sep='\t'):
     """Converts a text file that is delimited with first row being header to Pandas DataFrame
@@ -123,34 +131,478 @@ def text_to_df(filename,index=None,sep='\t'):
 
     return df
 
-def trieuclid(df1,df2,d3):
+def read_fasta(filename):
+    """Reads a FASTA file one record at a time
+
+    Parameters:
+        filename: (str) The location of the FASTA file
+
+    Returns:
+        records: (generator) Yields (name, seq) with the name being the header line without the >
+    """
+    name = None
+    seq = []
+    with open(filename,'r') as f:
+        for line in f:
+            line = line.rstrip()
+            if line.startswith('>'):
+                if name != None:
+                    yield name,''.join(seq)
+                name = line[1:]
+                seq = []
+            elif len(line) > 0:
+                seq.append(line)
+    if name != None:
+        yield name,''.join(seq)
+
+UCSC_DTYPES = {'#bin': np.int64, 'bin': np.int64, 'txStart': np.int64, 'txEnd': np.int64,
+               'cdsStart': np.int64, 'cdsEnd': np.int64, 'exonCount': np.int64, 'score': np.int64,
+               'chrom': 'category', 'strand': 'category', 'name2': 'category',
+               'cdsStartStat': 'category', 'cdsEndStat': 'category',
+               'name': object, 'exonStarts': object, 'exonEnds': object, 'exonFrames': object}
+
+UCSC_CACHE_VERSION = 2
+
+class ByteStrings(object):
+    """Strings kept as one concatenated byte buffer, string k is buf[offsets[k]:offsets[k+1]]"""
+    def __init__(self,buf,offsets):
+        self.buf = buf
+        self.offsets = offsets
+        self._bytes = None
+
+    def get(self,rows):
+        if self._bytes is None:
+            self._bytes = self.buf.tobytes()
+        b,o = self._bytes,self.offsets
+        vals = [b[o[r]:o[r + 1]] for r in rows.tolist()]
+        if bytes is not str:
+            vals = [v.decode('utf-8') for v in vals]
+        out = np.empty(len(vals),dtype=object)
+        out[:] = vals
+        return out
+
+class ExonStrings(object):
+    """exonStarts or exonEnds strings rebuilt from the flat exon arrays of ucsc_exon_arrays"""
+    def __init__(self,values,offsets):
+        self.values = values
+        self.offsets = offsets
+
+    def get(self,rows):
+        v,o = self.values,self.offsets
+        out = np.empty(len(rows),dtype=object)
+        for i,r in enumerate(rows.tolist()):
+            out[i] = ''.join(['%d,' % x for x in v[o[r]:o[r + 1]].tolist()])
+        return out
+
+class ObjectStrings(object):
+    """Strings that are already decoded into an object array"""
+    def __init__(self,values):
+        self.values = values
+
+    def get(self,rows):
+        return self.values[rows]
+
+class UcscStringDtype(ExtensionDtype):
+    """The dtype of UcscStringArray columns"""
+    name = 'ucsc_str'
+    type = str
+    kind = 'O'
+    na_value = np.nan
+
+    @classmethod
+    def construct_array_type(cls):
+        return UcscStringArray
+
+    @classmethod
+    def construct_from_string(cls,string):
+        if string == cls.name:
+            return cls()
+        raise TypeError("Cannot construct a '%s' from '%s'" % (cls.name,string))
+
+class UcscStringArray(ExtensionArray):
+    """A string column of a cached UCSC table, the strings are only decoded for the rows that are asked for
+
+    Parameters:
+        source: (ByteStrings, ExonStrings or ObjectStrings) Where the strings come from
+        rows: (numpy array of int) The rows of source making up this column
+    """
+    def __init__(self,source,rows):
+        self.source = source
+        self.rows = np.asarray(rows,dtype=np.int64)
+
+    @property
+    def dtype(self):
+        return UcscStringDtype()
+
+    @property
+    def nbytes(self):
+        return self.rows.nbytes
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self,item):
+        if pd.api.types.is_integer(item):
+            return self.source.get(self.rows[[item]])[0]
+        if isinstance(item,ExtensionArray):
+            item = np.asarray(item)
+        return UcscStringArray(self.source,self.rows[item])
+
+    def __iter__(self):
+        return iter(self.source.get(self.rows))
+
+    def __array__(self,dtype=None):
+        return np.asarray(self.source.get(self.rows),dtype=dtype)
+
+    def __eq__(self,other):
+        if isinstance(other,(pd.Series,pd.Index,pd.DataFrame)):
+            return NotImplemented
+        if pd.api.types.is_list_like(other):
+            other = np.asarray(other,dtype=object)
+        return np.asarray(self) == other
+
+    def __ne__(self,other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else ~eq
+
+    def __reduce__(self):
+        #pickles only the decoded rows, so per gene frames sent to workers stay small
+        return (UcscStringArray,(ObjectStrings(np.asarray(self)),np.arange(len(self))))
+
+    def isna(self):
+        return np.zeros(len(self),dtype=bool)
+
+    def take(self,indices,allow_fill=False,fill_value=None):
+        indices = np.asarray(indices,dtype=np.int64)
+        if allow_fill and (indices < 0).any():
+            vals = take(np.asarray(self),indices,allow_fill=True,fill_value=fill_value)
+            return UcscStringArray(ObjectStrings(vals),np.arange(len(vals)))
+        return UcscStringArray(self.source,self.rows.take(indices))
+
+    def copy(self,deep=False):
+        return UcscStringArray(self.source,self.rows.copy())
+
+    @classmethod
+    def _from_sequence(cls,scalars,dtype=None,copy=False):
+        vals = np.empty(len(scalars),dtype=object)
+        vals[:] = list(scalars)
+        return cls(ObjectStrings(vals),np.arange(len(vals)))
+
+    @classmethod
+    def _from_factorized(cls,values,original):
+        return cls._from_sequence(values)
+
+    @classmethod
+    def _concat_same_type(cls,to_concat):
+        to_concat = list(to_concat)
+        if all(a.source is to_concat[0].source for a in to_concat):
+            return cls(to_concat[0].source,np.concatenate([a.rows for a in to_concat]))
+        return cls._from_sequence(np.concatenate([np.asarray(a) for a in to_concat]))
+
+    def _values_for_factorize(self):
+        return np.asarray(self),np.nan
+
+    def _values_for_argsort(self):
+        return np.asarray(self)
+
+def ucsc_exon_arrays(df):
+    """Parses the exonStarts and exonEnds strings of a UCSC DataFrame into flat int arrays, exons of row k are starts[offsets[k]:offsets[k+1]]
+
+    Parameters:
+        df: (Pandas DataFrame) The UCSC DataFrame from ucsc_to_df, text_to_df or load_ucsc
+
+    Returns:
+        exons: (dict) 'offsets', 'starts' and 'ends' int64 numpy arrays, offsets has one more entry than df has rows
+    """
+    s_col,e_col = df['exonStarts'].values,df['exonEnds'].values
+    if isinstance(s_col,UcscStringArray) and isinstance(e_col,UcscStringArray) and \
+       isinstance(s_col.source,ExonStrings) and isinstance(e_col.source,ExonStrings) and \
+       s_col.source.offsets is e_col.source.offsets and np.array_equal(s_col.rows,e_col.rows):
+        #columns from load_ucsc, gather the rows straight from the cached arrays instead of parsing strings
+        src = s_col.source.offsets
+        counts = src[s_col.rows + 1] - src[s_col.rows]
+        offsets = np.zeros(len(counts) + 1,dtype=np.int64)
+        np.cumsum(counts,out=offsets[1:])
+        idx = np.arange(offsets[-1],dtype=np.int64) + np.repeat(src[s_col.rows] - offsets[:-1],counts)
+        return {'offsets': offsets, 'starts': s_col.source.values[idx], 'ends': e_col.source.values[idx]}
+
+    starts = np.fromstring(''.join(s_col),dtype=np.int64,sep=',')
+    ends = np.fromstring(''.join(e_col),dtype=np.int64,sep=',')
+    if 'exonCount' in df.columns:
+        counts = df['exonCount'].values.astype(np.int64)
+    else:
+        counts = np.array([s.count(',') for s in s_col],dtype=np.int64)
+
+    offsets = np.zeros(len(df) + 1,dtype=np.int64)
+    np.cumsum(counts,out=offsets[1:])
+    if len(starts) != offsets[-1] or len(ends) != offsets[-1]:
+        raise ValueError('exonStarts/exonEnds do not match exonCount')
+    return {'offsets': offsets, 'starts': starts, 'ends': ends}
+
+def ucsc_to_df(filename,index=None,sep='\t',chunksize=None):
+    """Loads a UCSC table (refGene, knownGene...) with int64 coordinates and categorical chrom, strand and name2, along with the parsed exon arrays
+
+    Parameters:
+        filename: (str) The location of the UCSC text file, first row being header
+        index: (str) The column that can be used as an index [Optional]
+        sep: (str) The separator used in the file [Optional]
+        chunksize: (int) If given, returns a generator of (df, exons) for every chunksize rows, for multi-GB dumps [Optional]
+
+    Returns:
+        df: (Pandas DataFrame) The typed UCSC DataFrame, exonStarts and exonEnds are kept as strings
+        exons: (dict) The flat exon arrays from ucsc_exon_arrays
+    """
+    with open(filename,'r') as f:
+        head = f.readline().rstrip('\r\n').split(sep)
+    dtypes = dict((c,UCSC_DTYPES[c]) for c in head if c in UCSC_DTYPES)
+    reader = pd.read_csv(filename,sep=sep,dtype=dtypes,index_col=index,
+                         keep_default_na=False,na_filter=False,chunksize=chunksize)
+    if chunksize is None:
+        return reader,ucsc_exon_arrays(reader)
+    return ((df,ucsc_exon_arrays(df)) for df in reader)
+
+def ucsc_cache_path(filename,sep='\t',cache_dir=None):
+    """Gets the cache directory for a UCSC text file, keyed on its absolute path, size, mtime and separator
+
+    Parameters:
+        filename: (str) The location of the UCSC text file
+        sep: (str) The separator used in the file [Optional]
+        cache_dir: (str) Where caches are kept, defaults to .kn_cache next to the file [Optional]
+
+    Returns:
+        path: (str) The directory that holds (or will hold) the cache for this version of the file
+    """
+    filename = os.path.abspath(filename)
+    st = os.stat(filename)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(filename),'.kn_cache')
+    #the format version keeps caches from an older layout from being read
+    key = '%s|%d|%r|%r|%d' % (filename,st.st_size,st.st_mtime,sep,UCSC_CACHE_VERSION)
+    return os.path.join(cache_dir,os.path.basename(filename) + '.' + hashlib.md5(key.encode('utf-8')).hexdigest())
+
+def str_lengths(values):
+    """Gets the length of the decimal string of every int in an array
+
+    Parameters:
+        values: (numpy array of int) The values
+
+    Returns:
+        lengths: (numpy array of int) The number of characters str gives for each value
+    """
+    a = np.abs(values)
+    lengths = 1 + (values < 0).astype(np.int64)
+    p = 10
+    for _ in range(18):
+        lengths += a >= p
+        p *= 10
+    return lengths
+
+def exon_strings_match(col,values,offsets):
+    """Checks that an exonStarts or exonEnds column is exactly what ExonStrings rebuilds from the flat exon arrays
+
+    Parameters:
+        col: (numpy array of str) The exonStarts or exonEnds strings
+        values: (numpy array of int) The matching flat exon array
+        offsets: (numpy array of int) The exon offsets
+
+    Returns:
+        match: (bool) Whether the column can be left out of the cache and rebuilt on demand
+    """
+    rows = np.repeat(np.arange(len(col)),np.diff(offsets))
+    want = np.bincount(rows,weights=str_lengths(values) + 1,minlength=len(col)).astype(np.int64)
+    have = np.fromiter((len(s) for s in col),dtype=np.int64,count=len(col))
+    return bool(np.array_equal(want,have))
+
+def save_strings(path,name,values):
+    """Saves strings as one uint8 byte buffer plus int64 offsets
+
+    Parameters:
+        path: (str) The directory to save into
+        name: (str) The file prefix, name_buf.npy and name_off.npy are written
+        values: (list of str) The strings
+    """
+    values = [v if isinstance(v,bytes) else v.encode('utf-8') for v in values]
+    offsets = np.zeros(len(values) + 1,dtype=np.int64)
+    np.cumsum([len(v) for v in values],out=offsets[1:])
+    np.save(os.path.join(path,name + '_buf.npy'),np.frombuffer(b''.join(values),dtype=np.uint8))
+    np.save(os.path.join(path,name + '_off.npy'),offsets)
+
+def load_strings(path,name):
+    """Loads strings saved by save_strings, the byte buffer stays memory mapped
+
+    Parameters:
+        path: (str) The directory to load from
+        name: (str) The file prefix given to save_strings
+
+    Returns:
+        strings: (ByteStrings) The strings, decoded on demand
+    """
+    return ByteStrings(np.load(os.path.join(path,name + '_buf.npy'),mmap_mode='r'),
+                       np.load(os.path.join(path,name + '_off.npy')))
+
+def num_file(path,dtype):
+    """Gets the file holding the numeric columns of one dtype in a UCSC cache
+
+    Parameters:
+        path: (str) The cache directory
+        dtype: (str) The numpy dtype string, like '<i8'
+
+    Returns:
+        fname: (str) The .npy file
+    """
+    return os.path.join(path,'num_%s.npy' % np.dtype(dtype).name)
+
+def write_ucsc_cache(path,df,exons):
+    """Writes a DataFrame from ucsc_to_df and its exon arrays as a bundle of .npy files, exonStarts and exonEnds are left out since the exon arrays hold them
+
+    Parameters:
+        path: (str) The cache directory from ucsc_cache_path
+        df: (Pandas DataFrame) The typed UCSC DataFrame, without an index column set
+        exons: (dict) The flat exon arrays from ucsc_exon_arrays
+    """
+    parent = os.path.dirname(path)
+    if not os.path.exists(parent):
+        os.makedirs(parent)
+    tmp = tempfile.mkdtemp(dir=parent)
+    try:
+        meta = {'columns': [], 'kinds': [], 'groups': {}, 'rows': len(df)}
+        for i,c in enumerate(df.columns):
+            col = df[c]
+            if str(col.dtype) == 'category':
+                np.save(os.path.join(tmp,'col%d.npy' % i),col.cat.codes.values)
+                save_strings(tmp,'cat%d' % i,[str(x) for x in col.cat.categories])
+                kind = 'category'
+            elif c in ['exonStarts','exonEnds'] and \
+                 exon_strings_match(col.values,exons['starts' if c == 'exonStarts' else 'ends'],exons['offsets']):
+                kind = 'exons'
+            elif col.dtype == object:
+                save_strings(tmp,'col%d' % i,[str(x) for x in col.values])
+                kind = 'str'
+            else:
+                #numeric columns of one dtype share a (columns, rows) array so they load as one block
+                meta['groups'].setdefault(col.dtype.str,[]).append(c)
+                kind = 'num'
+            meta['columns'].append(c)
+            meta['kinds'].append(kind)
+        for k,cols in meta['groups'].items():
+            np.save(num_file(tmp,k),np.ascontiguousarray(np.stack([df[c].values for c in cols])))
+        for k in ['offsets','starts','ends']:
+            np.save(os.path.join(tmp,'exon_' + k + '.npy'),exons[k])
+        with open(os.path.join(tmp,'meta.json'),'w') as f:
+            json.dump(meta,f)
+        os.rename(tmp,path)
+    except OSError:
+        #another process may have written the same cache first
+        shutil.rmtree(tmp,ignore_errors=True)
+        if not os.path.exists(path):
+            raise
+
+def read_ucsc_cache(path):
+    """Reads a cache written by write_ucsc_cache, numeric columns stay memory mapped and string columns are only decoded for the rows that are used
+
+    Parameters:
+        path: (str) The cache directory from ucsc_cache_path
+
+    Returns:
+        df: (Pandas DataFrame) The typed UCSC DataFrame, string columns are UcscStringArray
+        exons: (dict) The flat exon arrays, as read only memory maps
+    """
+    with open(os.path.join(path,'meta.json'),'r') as f:
+        meta = json.load(f)
+    exons = dict((k,np.load(os.path.join(path,'exon_' + k + '.npy'),mmap_mode='r')) for k in ['offsets','starts','ends'])
+    rows = np.arange(meta['rows'],dtype=np.int64)
+
+    #the biggest numeric group becomes the frame's block as a view of the memory map,
+    #every other column is inserted in place since reordering or assigning would copy it
+    groups = sorted(meta['groups'].items(),key=lambda g: -len(g[1]))
+    if groups:
+        df = pd.DataFrame(np.load(num_file(path,groups[0][0]),mmap_mode='r').T,columns=groups[0][1],copy=False)
+    else:
+        df = pd.DataFrame(index=pd.RangeIndex(len(rows)))
+    others = {}
+    for k,cols in groups[1:]:
+        mm = np.load(num_file(path,k),mmap_mode='r')
+        for j,c in enumerate(cols):
+            others[c] = mm[j]
+
+    for i,(c,kind) in enumerate(zip(meta['columns'],meta['kinds'])):
+        if kind == 'num':
+            if c in others:
+                df.insert(i,c,others[c])
+            continue
+        if kind == 'category':
+            cats = load_strings(path,'cat%d' % i)
+            col = pd.Categorical.from_codes(np.load(os.path.join(path,'col%d.npy' % i)),cats.get(np.arange(len(cats.offsets) - 1)))
+        elif kind == 'exons':
+            col = UcscStringArray(ExonStrings(exons['starts' if c == 'exonStarts' else 'ends'],exons['offsets']),rows)
+        else:
+            col = UcscStringArray(load_strings(path,'col%d' % i),rows)
+        df.insert(i,c,col)
+    return df,exons
+
+def load_ucsc(filename,index=None,sep='\t',cache_dir=None):
+    """Loads a UCSC table like ucsc_to_df, reusing a binary cache when the file has not changed since it was last parsed
+
+    Parameters:
+        filename: (str) The location of the UCSC text file, first row being header
+        index: (str) The column that can be used as an index [Optional]
+        sep: (str) The separator used in the file [Optional]
+        cache_dir: (str) Where caches are kept, defaults to .kn_cache next to the file [Optional]
+
+    Returns:
+        df: (Pandas DataFrame) The typed UCSC DataFrame, string columns are UcscStringArray when the cache could be used
+        exons: (dict) The flat exon arrays from ucsc_exon_arrays
+    """
+    path = ucsc_cache_path(filename,sep,cache_dir)
+    if not os.path.exists(os.path.join(path,'meta.json')):
+        df,exons = ucsc_to_df(filename,sep=sep)
+        try:
+            write_ucsc_cache(path,df,exons)
+        except (IOError,OSError):
+            #unwritable location, the parsed table is still usable
+            if index != None:
+                df = df.set_index(index)
+            return df,exons
+
+    #read back even after writing, so the first load gives the same memory mapped frame as later ones
+    df,exons = read_ucsc_cache(path)
+
+    if index != None:
+        df = df.set_index(index)
+    return df,exons
+
+def replicate_dists(dfs,cols=['cyt','mem','ins']):
+    """Gets the pairwise euclidean distance matrix between k replicate DataFrames for every gene they share, genes with an all zero vector in any replicate are left out
+
+    Parameters:
+        dfs: (list of Pandas DataFrame) The replicate DataFrames, with cyt, mem, ins columns like adj_df gives
+        cols: (list of str) The columns making up each vector [Optional]
+
+    Returns:
+        dists: (numpy array of float) genes by k by k distance matrices
+        genes: (list of str) The genes, in the order of the first DataFrame
+    """
+    genes = dfs[0].index
+    for df in dfs[1:]:
+        genes = genes[genes.isin(df.index)]
+    vecs = np.stack([df.loc[genes,cols].values.astype(np.float64) for df in dfs],axis=1)
+
+    keep = (vecs.sum(axis=2) != 0).all(axis=1)
+    vecs = vecs[keep]
+    diff = vecs[:,:,None,:] - vecs[:,None,:,:]
+    dists = np.sqrt((diff**2).sum(axis=3))
+    return dists,list(genes[keep])
+
+def trieuclid(df1,df2,df3,*dfs):
     """Gets a list of the perimeters of the triangle created by the gene locations of each gene in each of df1,2,3...Returns the list of distances and the ordered list of genes...MUST HAVE THE SAME MEF NAME
 
     Parameters:
         df1: (Pandas Dataframe) The first MEF DataFrame
         df2: (Pandas Dataframe) The second MEF DataFrame
         df3: (Pandas Dataframe) The third MEF DataFrame
+        dfs: (Pandas Dataframe) More replicates, the perimeter is then the sum of all pairwise distances [Optional]
     """
-    genes = list(df1.index)
-    mef = df1.columns[0].split('_')[0] + '_' + df1.columns[0].split('_')[1]
-    c = 'cyt'
-    m = 'mem'
-    i = 'ins'
-    
-    incl_dist = []
-    incl_genes = []
-    for g in genes:
-        vecs = []
-        for df in [df1,df2,df3]:
-            temp = [df.loc[g,c],df.loc[g,m],df.loc[g,i]]
-            temp = [float(item) for item in temp]
-            df.append(temp)
-
-        if sum(vecs[0]) != 0 and sum(vecs[1]) != 0 and sum(vecs[2]) != 0:
-            v1 = vecs[0]
-            v2 = vecs[1]
-            v3 = vecs[2]
-            incl_dist.append(euclidean(v1,v2)+euclidean(v1,v3)+euclidean(v2,v3))
-            incl_genes.append(g)
-    
+    dists,incl_genes = replicate_dists([df1,df2,df3] + list(dfs))
+    i,j = np.triu_indices(dists.shape[1],1)
+    incl_dist = list(dists[:,i,j].sum(axis=1))
     return incl_dist,incl_genes
@@ -0,0 +1,74 @@
+#Copy paste into terminal:
+#python bench_basic_tools.py -rows 50000 -cols 200 -n 5000
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from basic_tools.basic_tools import filter_df,redact_df,get_certain_mef
+
+def getOptions():
+	"""Function to pull in arguments"""
+	parser = argparse.ArgumentParser()
+
+	parser.add_argument('-rows',dest='rows',type=int,default=50000,help='Number of rows in the table')
+	parser.add_argument('-cols',dest='cols',type=int,default=200,help='Number of columns in the table')
+	parser.add_argument('-n',dest='n',type=int,default=5000,help='Number of rows and columns to select')
+
+	args = parser.parse_args()
+	return args
+
+def old_filter_df(df,indexes):
+	"""The cell by cell filter_df, kept for comparison"""
+	head = df.columns
+	data = []
+	for i in indexes:
+		row = []
+		for c in head:
+			row.append(df.get_value(i,c))
+		data.append(row)
+	new_df = pd.DataFrame(data,columns=head)
+	new_df.index = indexes
+	return new_df
+
+def old_redact_df(df,columns):
+	"""The column list redact_df, kept for comparison"""
+	ind = df.index
+	data = []
+	for c in columns:
+		vert = list(df[c])
+		data.append(vert)
+	new_df = pd.DataFrame(data)
+	new_df = new_df.transpose()
+	new_df.columns = columns
+	new_df.index = ind
+	return new_df
+
+def timed(func,*args):
+	"""Runs func once and gives the seconds it took"""
+	start = time.time()
+	func(*args)
+	return time.time() - start
+
+def main(args):
+	rs = np.random.RandomState(0)
+	types = ['cyt','mem','ins']
+	columns = ['MEF' + str(k // 3) + '_' + types[k % 3] for k in range(args.cols)]
+	df = pd.DataFrame(rs.rand(args.rows,args.cols),columns=columns,index=['gene' + str(k) for k in range(args.rows)])
+
+	indexes = list(rs.choice(df.index,min(args.n,args.rows),replace=False))
+	cols = list(rs.choice(df.columns,min(args.n,args.cols),replace=False))
+	mef = columns[0].split('_')[0]
+
+	results = [['filter_df',timed(old_filter_df,df,indexes),timed(filter_df,df,indexes)],
+	           ['redact_df',timed(old_redact_df,df,cols),timed(redact_df,df,cols)],
+	           ['get_certain_mef',timed(old_redact_df,df,[mef + '_' + t for t in types]),timed(get_certain_mef,df,mef)]]
+
+	print('%d x %d table, %d rows / %d columns selected' % (args.rows,args.cols,len(indexes),len(cols)))
+	for name,old,new in results:
+		print('%-16s old %9.4fs  new %9.4fs  speedup %8.1fx' % (name,old,new,old / max(new,1e-9)))
+
+if __name__ == '__main__':
+	args = getOptions()
+	main(args)
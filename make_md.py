@@ -43,7 +43,7 @@ def main(args):
 			if len(line) > 0:
 				if line.find('\"\"\"') != -1:
 					in_desc = not in_desc
-				if line.find('def ') == 0:
+				if (line.find('def ') == 0 and line.find('def __') != 0) or line.find('class ') == 0:
 					if func != '':
 						doc += '### ' + func + '()\n'
 						doc += '#### Description:\n' + '* ' + desc + '\n\n'
@@ -75,7 +75,7 @@ def main(args):
 					ret = False
 					params = []
 					rets = []
-					func = line.split(' ')[1].split('(')[0]
+					func = line.split(' ')[1].split('(')[0].split(':')[0]
 				elif in_desc:
 					if func != '' and desc == '':
 						desc = line[3:]
@@ -2,6 +2,10 @@ import pandas as pd
 import numpy as np
 import networkx as nx
 import copy as copy
+import multiprocessing as mp
+import heapq
+
+from kn_tools.basic_tools import ucsc_exon_arrays
 
 def get_rna_dfs(rna,data_df):
 	"""Filters the UCSC dataframe for a specified RNA in the name2 column, gives a list of one or two dataframes, drops non coding rna
@@ -14,7 +18,17 @@ def get_rna_dfs(rna,data_df):
 		final_df: (Pandas DataFrame) Filtered DataFrame, returns None if there is more than one strand defined
 	"""
 	temp_df = data_df[data_df['name2'] == rna]
+	return drop_non_coding(temp_df)
 
+def drop_non_coding(temp_df):
+	"""Drops the non coding rna from the UCSC rows of a single RNA, used by get_rna_dfs and get_batch_paths
+	
+	Parameters:
+		temp_df: (Pandas DataFrame) The UCSC rows sharing one name2 value
+	
+	Returns:
+		final_df: (Pandas DataFrame) Filtered DataFrame, returns None if there is more than one strand defined
+	"""
 	strands = list(set(temp_df['strand']))
 	if len(strands) >= 2:
 		return None
@@ -37,52 +51,106 @@ def get_lookup1(df):
 	Returns:
 		lookup_df: (Pandas DataFrame) The first lookup table for exon ID, has upper and lower bounds for each exon, all exons, and number of diff forms per exon
 	"""
-	#get all exons
-	master_exons = []
 	strand = list(set(df['strand']))[0]
-	for index,row in df.iterrows():
-		s = map(int,row.get_value('exonStarts')[:-1].split(','))
-		e = map(int,row.get_value('exonEnds')[:-1].split(','))
-		for i in range(len(s)):
-			if not (s[i],e[i]) in master_exons:
-				master_exons.append((s[i],e[i]))
-	master_exons = np.array(master_exons,dtype = [('start',int),('end',int)])
-	exons_arr = np.sort(master_exons,order=['start','end'])
-	
-	#check for overlap with exons
-	ex_num = 1
-	ex_data = []
-	for i in range(len(exons_arr)):
-		to_append = []
-		if i != 0:
-			if list(exons_arr[i-1]) + list(exons_arr[i]) == sorted(list(exons_arr[i-1]) + list(exons_arr[i])):
-				ex_num += 1
-		
-		to_append.append(ex_num)
-		to_append.append(exons_arr[i][0])
-		to_append.append(exons_arr[i][1])
-		ex_data.append(to_append)
-		
-	#if there is overlap, this will maintain that starts and ends are lower/upper bound
-	to_df = []
-	ex_inds = list(set([item[0] for item in ex_data]))
-	for i in ex_inds:
-		temp = [item for item in ex_data if item[0] == i]
-		starts = [item[1] for item in temp]
-		ends = [item[2] for item in temp]
-		s = min(starts)
-		e = max(ends)
-		
-		if strand == '-':
-			adj_ex_ind = len(ex_inds) - i + 1
-		else:
-			 adj_ex_ind = i
+	exons = ucsc_exon_arrays(df)
+	genes = np.zeros(len(exons['starts']),dtype=np.int64)
+	
+	lookup_df = lookup1_from_exons(genes,exons['starts'],exons['ends'],[strand])
+	return lookup_df.drop('gene',axis=1)
+
+def get_all_lookup1(data_df,coding_only=True):
+	"""Gets the first lookup table for every gene of a UCSC dataframe at once, genes are grouped by name2 and strand
+	
+	Parameters:
+		data_df: (Pandas DataFrame) The UCSC dataframe from text_to_df or ucsc_to_df
+		coding_only: (boolean) True to drop the non coding rna like get_rna_dfs [Optional]
+	
+	Returns:
+		lookup_df: (Pandas DataFrame) get_lookup1 tables of all genes stacked, with a name2 column in front
+	"""
+	if coding_only:
+		data_df = data_df[data_df['cdsStart'].astype(np.int64) != data_df['cdsEnd'].astype(np.int64)]
+	exons = ucsc_exon_arrays(data_df)
+	keys = data_df['name2'].astype(str) + '\t' + data_df['strand'].astype(str)
+	codes,uniq = pd.factorize(keys,sort=True)
+	genes = np.repeat(codes,np.diff(exons['offsets']))
+	names = [key.split('\t')[0] for key in uniq]
+	strands = [key.split('\t')[1] for key in uniq]
+	
+	lookup_df = lookup1_from_exons(genes,exons['starts'],exons['ends'],strands)
+	lookup_df.insert(0,'name2',[names[g] for g in lookup_df['gene']])
+	return lookup_df.drop('gene',axis=1)
 
-		to_df.append([adj_ex_ind,s,e,','.join(map(str,starts)),','.join(map(str,ends)),len(ends)])
+def cluster_exons(genes,starts,ends):
+	"""Dedups the exons and groups overlapping ones with a sort and cumulative max sweep, exons of different genes are never grouped
+	
+	Parameters:
+		genes: (numpy array of int) Gene code of every exon, all zeros for a single gene
+		starts: (numpy array of int) Start of every exon
+		ends: (numpy array of int) End of every exon
+	
+	Returns:
+		genes: (numpy array of int) Gene code of every unique exon, sorted by gene, start and end
+		starts: (numpy array of int) Start of every unique exon
+		ends: (numpy array of int) End of every unique exon
+		bounds: (numpy array of int) Position of the first unique exon of each cluster, followed by the number of unique exons
+	"""
+	genes = np.asarray(genes,dtype=np.int64)
+	starts = np.asarray(starts,dtype=np.int64)
+	ends = np.asarray(ends,dtype=np.int64)
+	if len(starts) == 0:
+		return genes,starts,ends,np.zeros(1,dtype=np.int64)
+
+	order = np.lexsort((ends,starts,genes))
+	genes,starts,ends = genes[order],starts[order],ends[order]
+	uniq = np.ones(len(starts),dtype=bool)
+	uniq[1:] = (genes[1:] != genes[:-1]) | (starts[1:] != starts[:-1]) | (ends[1:] != ends[:-1])
+	genes,starts,ends = genes[uniq],starts[uniq],ends[uniq]
+	
+	#shift each gene past the last one so the running max restarts for every gene
+	rank = np.concatenate([[0],np.cumsum(genes[1:] != genes[:-1])])
+	span = ends.max() - min(starts.min(),0) + 1
+	reach = np.maximum.accumulate(ends + rank*span)
+	new = starts[1:] + rank[1:]*span >= reach[:-1]
+	bounds = np.concatenate([[0],np.flatnonzero(new) + 1,[len(starts)]])
+	return genes,starts,ends,bounds
+
+def lookup1_from_exons(genes,starts,ends,strands):
+	"""Builds get_lookup1 tables from flat exon arrays, used by get_lookup1 and get_all_lookup1
+	
+	Parameters:
+		genes: (numpy array of int) Gene code of every exon, indexes strands
+		starts: (numpy array of int) Start of every exon
+		ends: (numpy array of int) End of every exon
+		strands: (list of str) The strand of each gene code
+	
+	Returns:
+		lookup_df: (Pandas DataFrame) The lookup tables stacked, with a gene column holding the gene code
+	"""
+	genes,starts,ends,bounds = cluster_exons(genes,starts,ends)
+	first = bounds[:-1]
+	
+	c_genes = genes[first]
+	lb = starts[first]
+	ub = np.maximum.reduceat(ends,first) if len(first) > 0 else ends[:0]
+	count = np.diff(bounds)
+	
+	#number the clusters within each gene, backwards on the minus strand
+	g_first = np.concatenate([[True],c_genes[1:] != c_genes[:-1]]) if len(first) > 0 else np.zeros(0,dtype=bool)
+	g_start = np.flatnonzero(g_first)
+	g_size = np.diff(np.concatenate([g_start,[len(first)]]))
+	num = np.arange(len(first)) - np.repeat(g_start,g_size) + 1
+	minus = np.array([strands[g] == '-' for g in c_genes],dtype=bool)
+	num = np.where(minus,np.repeat(g_size,g_size) - num + 1,num)
 	
-	#create the dataframe
-	lookup_df = pd.DataFrame(to_df,columns=['exon','lb','ub','starts','ends','#']).set_index('exon')
-	lookup_df.insert(len(lookup_df.columns),'strand',strand)
+	s_str = starts.astype(str)
+	e_str = ends.astype(str)
+	all_starts = [','.join(s_str[bounds[k]:bounds[k+1]]) for k in range(len(first))]
+	all_ends = [','.join(e_str[bounds[k]:bounds[k+1]]) for k in range(len(first))]
+	
+	lookup_df = pd.DataFrame({'exon': num,'gene': c_genes,'lb': lb,'ub': ub,'starts': all_starts,'ends': all_ends,'#': count},
+		columns=['exon','gene','lb','ub','starts','ends','#']).set_index('exon')
+	lookup_df.insert(len(lookup_df.columns),'strand',[strands[g] for g in c_genes])
 	return lookup_df
 
 def get_lookup2(df):
@@ -140,12 +208,27 @@ def get_lookup2(df):
 	lu2.index.name = 'pseudoexon'
 	return lu2
 
-def get_pexons(df,lu_df=[]):
+def get_pexon_index(lu_df):
+	"""Gets a hash index from (start, end) to pseudoexon ID for a lookup table 2, build it once per gene
+	
+	Parameters:
+		lu_df: (Pandas DataFrame) The second lookup table from get_lookup2
+	
+	Returns:
+		pex_index: (Pandas MultiIndex) The (start, end) of each row of lu_df, get_indexer gives the row position
+		pex_ids: (numpy array of int) The pseudoexon ID of each row of lu_df
+	"""
+	pex_index = pd.MultiIndex.from_arrays([lu_df['start'].values.astype(np.int64),lu_df['end'].values.astype(np.int64)])
+	pex_ids = np.asarray(lu_df.index,dtype=np.int64)
+	return pex_index,pex_ids
+
+def get_pexons(df,lu_df=[],pex_index=None):
 	"""Gets the psuedoexons for the given RNA DataFrame produced by get_rna_dfs
 	
 	Parameters:
 		df: (Pandas DataFrame) The RNA DataFrame produced by get_rna_dfs
 		lu_df: (Pandas DataFrame) If lookup table 2 has already been produced, you can input it [Optional]
+		pex_index: (tuple) If get_pexon_index has already been run on lu_df, you can input its output [Optional]
 	
 	Returns:
 		strand_nodes: (list) A list of the psuedoexons for conversion to a graph
@@ -155,39 +238,31 @@ def get_pexons(df,lu_df=[]):
 	"""
 	if len(lu_df) == 0:
 		lu_df = get_lookup2(df)
+	if pex_index is None:
+		pex_index = get_pexon_index(lu_df)
+	lookup,pex_ids = pex_index
+	
+	#sort the starts and ends within each transcript, then look every exon up at once
+	exons = ucsc_exon_arrays(df)
+	offsets = exons['offsets']
+	tx = np.repeat(np.arange(len(df)),np.diff(offsets))
+	s = exons['starts'][np.lexsort((exons['starts'],tx))]
+	e = exons['ends'][np.lexsort((exons['ends'],tx))]
+	found = lookup.get_indexer(pd.MultiIndex.from_arrays([s,e]))
+	if (found == -1).any():
+		raise ValueError('Exon not found in the lookup table')
+	pex = pex_ids[found]
 	
-	detailed = []
-	names = []
 	strand_nodes = []
-	indexes = []
-	for index,row in df.iterrows():
-		s = sorted(map(int,row.get_value('exonStarts')[:-1].split(',')))
-		e = sorted(map(int,row.get_value('exonEnds')[:-1].split(',')))
-		exons = [[s[i],e[i]] for i in range(len(s))]
-		
-		pnodes = []
-		nodes = []
-		lu_exons = [[lu_df.loc[j][1],lu_df.loc[j][2]] for j in range(1,len(lu_df)+1)]
-
-		if row.get_value('strand') == '+':
-			order = range(0,len(exons))
-		else:
-			order = range(len(exons)-1,-1,-1)
-		for i in order:
-			exon = exons[i]
-
-			if exon in lu_exons:
-				pex_ind = lu_exons.index(exon)+1
-				pnodes.append(pex_ind)
-			else:
-				raise
-
-
-		detailed.append(map(int,[df.loc[index,'cdsStart'],df.loc[index,'cdsEnd']]))
-		names.append(df.loc[index,'name'])
+	for k,strand in enumerate(df['strand']):
+		pnodes = pex[offsets[k]:offsets[k+1]].tolist()
+		if strand != '+':
+			pnodes.reverse()
 		strand_nodes.append(pnodes)
-		indexes.append(index)
-		
+	
+	detailed = [list(item) for item in zip(df['cdsStart'].astype(np.int64).tolist(),df['cdsEnd'].astype(np.int64).tolist())]
+	names = list(df['name'])
+	indexes = list(df.index)
 	return strand_nodes,detailed,names,indexes
 
 def get_graph(strand_nodes):
@@ -197,59 +272,243 @@ def get_graph(strand_nodes):
 		strand_nodes: (list) A list of the psuedoexons for conversion to a graph created by get_pexons
 	
 	Returns:
-		G: (Networkx DiGraph) The digraph created by the list of nodes
+		G: (Networkx DiGraph) The digraph created by the list of nodes, edge weight is the number of strands using the edge
 		se_pairs: (list of lists) List of all possible start,end pairs in the graph
 	"""
 	G = nx.DiGraph()
 	se_pairs = set([])
 	for strand in strand_nodes:
-		G.add_path(strand)
+		G.add_nodes_from(strand)
+		for u,v in zip(strand[:-1],strand[1:]):
+			if G.has_edge(u,v):
+				G[u][v]['weight'] += 1
+			else:
+				G.add_edge(u,v,weight=1)
 		se_pairs.add((min(strand),max(strand)))
 	se_pairs = [list(item) for item in list(se_pairs)]
 	return G,se_pairs
 
-def get_all_paths(rna,data_df,detail=False):
+def count_paths(G,se_pairs):
+	"""Counts the paths between all start,end pairs with dynamic programming over the DAG, without enumerating them
+	
+	Parameters:
+		G: (Networkx DiGraph) The digraph from get_graph
+		se_pairs: (list of lists) The start,end pairs from get_graph
+	
+	Returns:
+		total: (int) The number of paths get_all_paths would produce
+	"""
+	order = list(nx.topological_sort(G))
+	total = 0
+	for source in set(se[0] for se in se_pairs):
+		targets = set(se[1] for se in se_pairs if se[0] == source and se[1] != source)
+		counts = {source: 1}
+		for node in order[order.index(source):]:
+			c = counts.get(node,0)
+			if c == 0:
+				continue
+			for succ in G.successors(node):
+				counts[succ] = counts.get(succ,0) + c
+		total += sum(counts.get(t,0) for t in targets)
+	return total
+
+def get_top_paths(G,se_pairs,n):
+	"""Gets at most n paths between the start,end pairs, ranked by the summed edge weight (how often each junction was observed)
+	
+	Parameters:
+		G: (Networkx DiGraph) The digraph from get_graph
+		se_pairs: (list of lists) The start,end pairs from get_graph
+		n: (int) The maximum number of paths
+	
+	Returns:
+		paths: (generator) Yields (score, path) from the highest score down
+	"""
+	order = list(nx.topological_sort(G))
+	found = []
+	for source in set(se[0] for se in se_pairs):
+		targets = set(se[1] for se in se_pairs if se[0] == source and se[1] != source)
+		#the n best partial paths from source into each node
+		best = {source: [(0,[source])]}
+		for node in order[order.index(source):]:
+			if not node in best:
+				continue
+			if node in targets:
+				found.extend(best[node])
+			for succ in G.successors(node):
+				w = G[node][succ].get('weight',1)
+				cand = best.get(succ,[]) + [(score + w,path + [succ]) for score,path in best[node]]
+				best[succ] = heapq.nlargest(n,cand,key=lambda item: item[0])
+	for item in heapq.nlargest(n,found,key=lambda item: item[0]):
+		yield item
+
+def get_path_counts(data_df,rnas=None):
+	"""Counts the paths of many RNAs without enumerating them, to triage genes before get_batch_paths
+	
+	Parameters:
+		data_df: (Pandas DataFrame) The UCSC dataframe from text_to_df
+		rnas: (list of str) The names in the name2 column to count, all of them if None [Optional]
+	
+	Returns:
+		counts: (dictionary) The number of paths for each rna, None if a strange rna
+	"""
+	if rnas is not None:
+		data_df = data_df[data_df['name2'].isin(rnas)]
+	counts = {}
+	for rna,temp_df in data_df.groupby('name2',sort=False,observed=True):
+		df = drop_non_coding(temp_df)
+		if df is None or len(df) == 0:
+			counts[rna] = None
+			continue
+		pnodes,pdetailed,names,indexes = get_pexons(df)
+		G,se_pairs = get_graph(pnodes)
+		counts[rna] = count_paths(G,se_pairs)
+	return counts
+
+def get_all_paths(rna,data_df,detail=False,max_paths=None,debug=False):
 	"""Gets all paths with replacement of the pseudoexons, adds an '*' if it exists
 	
 	Parameters:
 		rna: (str) The name of the RNA in the name2 column
 		data_df: (Pandas DataFrame) The UCSC dataframe from text_to_df
 		detail: (boolean) False if output is nodes, True for start and ends [Optional]
+		max_paths: (int) Only produce this many paths, the best ranked by get_top_paths [Optional]
+		debug: (boolean) True to print the lookup table, pnodes and every path [Optional]
 	
 	Returns:
 		paths: (list) List of all paths produced, None if a strange rna
 	"""
 	df = get_rna_dfs(rna,data_df)
-	if df is None:
+	return get_df_paths(rna,df,detail=detail,max_paths=max_paths,debug=debug)
+
+def iter_all_paths(rna,data_df,detail=False,max_paths=None,debug=False):
+	"""Generator version of get_all_paths, yields each path as it is found so memory does not grow with the number of paths
+	
+	Parameters:
+		rna: (str) The name of the RNA in the name2 column
+		data_df: (Pandas DataFrame) The UCSC dataframe from text_to_df
+		detail: (boolean) False if output is nodes, True for start and ends [Optional]
+		max_paths: (int) Only produce this many paths, the best ranked by get_top_paths [Optional]
+		debug: (boolean) True to print the lookup table, pnodes and every path [Optional]
+	
+	Returns:
+		paths: (generator) Yields the paths of get_all_paths, nothing if a strange rna
+	"""
+	df = get_rna_dfs(rna,data_df)
+	return iter_df_paths(rna,df,detail=detail,max_paths=max_paths,debug=debug)
+
+def get_df_paths(rna,df,detail=False,max_paths=None,debug=False):
+	"""Gets all paths for an RNA DataFrame that has already been filtered by get_rna_dfs or drop_non_coding
+	
+	Parameters:
+		rna: (str) The name of the RNA in the name2 column
+		df: (Pandas DataFrame) The filtered RNA DataFrame, may be None
+		detail: (boolean) False if output is nodes, True for start and ends [Optional]
+		max_paths: (int) Only produce this many paths, the best ranked by get_top_paths [Optional]
+		debug: (boolean) True to print the lookup table, pnodes and every path [Optional]
+	
+	Returns:
+		paths: (list) List of all paths produced, None if a strange rna
+	"""
+	if df is None or len(df) == 0:
 		return None
-	paths = []
+	return list(iter_df_paths(rna,df,detail=detail,max_paths=max_paths,debug=debug))
+
+def iter_df_paths(rna,df,detail=False,max_paths=None,debug=False):
+	"""Generator version of get_df_paths, yields each path as it is found
+	
+	Parameters:
+		rna: (str) The name of the RNA in the name2 column
+		df: (Pandas DataFrame) The filtered RNA DataFrame, may be None
+		detail: (boolean) False if output is nodes, True for start and ends [Optional]
+		max_paths: (int) Only produce this many paths, the best ranked by get_top_paths [Optional]
+		debug: (boolean) True to print the lookup table, pnodes and every path [Optional]
+	
+	Returns:
+		paths: (generator) Yields the paths of get_df_paths, nothing if a strange rna
+	"""
+	if df is None or len(df) == 0:
+		return
 	lu_df = get_lookup2(df)
-	print lu_df
+	if debug:
+		print lu_df
 	pnodes,pdetailed,names,indexes = get_pexons(df,lu_df)
 	index = list(df.index)[0]
 	strand = df.loc[index,'strand']
 	chrom = df.loc[index,'chrom']
-	print pnodes
+	if debug:
+		print pnodes
 	G,se_pairs = get_graph(pnodes)
 	
-	for se in se_pairs:
-		for path in nx.all_simple_paths(G, source=se[0], target=se[1]):
-			path = list(path)
+	#first strand for every known path, and the lookup columns by pseudoexon
+	known = {}
+	for ind,nodes in enumerate(pnodes):
+		known.setdefault(tuple(nodes),ind)
+	bounds = dict((item,[lu_df.loc[item,'start'],lu_df.loc[item,'end']]) for item in lu_df.index)
+	
+	if max_paths is None:
+		found = (path for se in se_pairs for path in nx.all_simple_paths(G, source=se[0], target=se[1]))
+	else:
+		found = (path for score,path in get_top_paths(G,se_pairs,max_paths))
+	
+	for path in found:
+		path = list(path)
+		if debug:
 			print path
-			if path in pnodes:
-				if detail:
-					ind = pnodes.index(path)
-					irl = pdetailed[ind]
-					realname = names[ind]
-					paths.append([rna,strand,chrom,realname]+[[lu_df.loc[item,'start'],lu_df.loc[item,'end']] for item in path]+irl)
-
-				else:
-					paths.append([rna,strand,chrom,realname]+[lu_df.loc[item,'exon'] for item in path])
+		if tuple(path) in known:
+			ind = known[tuple(path)]
+			realname = names[ind]
+			if detail:
+				irl = pdetailed[ind]
+				yield [rna,strand,chrom,realname]+[list(bounds[item]) for item in path]+irl
+
 			else:
-				if detail:
-					paths.append([rna,strand,chrom,' ']+[[lu_df.loc[item,'start'],lu_df.loc[item,'end']] for item in path])
-				else:
-					paths.append([rna,strand,chrom,' ']+map(str,path))
-				
-	return paths
+				yield [rna,strand,chrom,realname]+[lu_df.loc[item,'exon'] for item in path]
+		else:
+			if detail:
+				yield [rna,strand,chrom,' ']+[list(bounds[item]) for item in path]
+			else:
+				yield [rna,strand,chrom,' ']+map(str,path)
 
+def get_gene_paths(job):
+	"""Worker for get_batch_paths, runs drop_non_coding and get_df_paths for a single gene
+	
+	Parameters:
+		job: (tuple) (rna, UCSC rows for the rna, detail flag, max_paths)
+	
+	Returns:
+		result: (tuple) (rna, paths from get_df_paths)
+	"""
+	rna,temp_df,detail,max_paths = job
+	return rna,get_df_paths(rna,drop_non_coding(temp_df),detail=detail,max_paths=max_paths)
+
+def get_batch_paths(data_df,rnas=None,detail=False,max_paths=None,processes=None,chunksize=1):
+	"""Gets all paths for many RNAs, groups the UCSC dataframe by name2 once and streams back (rna, paths) as each gene finishes
+	
+	Parameters:
+		data_df: (Pandas DataFrame) The UCSC dataframe from text_to_df
+		rnas: (list of str) The names in the name2 column to run, all of them if None [Optional]
+		detail: (boolean) False if output is nodes, True for start and ends [Optional]
+		max_paths: (int) Only produce this many paths per gene, the best ranked by get_top_paths [Optional]
+		processes: (int) Number of worker processes, defaults to the cpu count, 1 runs in this process [Optional]
+		chunksize: (int) Number of genes sent to a worker at a time [Optional]
+	
+	Returns:
+		results: (generator) Yields (rna, paths) in order of completion, paths is None for a strange rna
+	"""
+	if rnas is not None:
+		data_df = data_df[data_df['name2'].isin(rnas)]
+	jobs = ((rna,temp_df,detail,max_paths) for rna,temp_df in data_df.groupby('name2',sort=False,observed=True))
+	
+	if processes == 1:
+		for job in jobs:
+			yield get_gene_paths(job)
+		return
+	
+	pool = mp.Pool(processes)
+	try:
+		for result in pool.imap_unordered(get_gene_paths,jobs,chunksize):
+			yield result
+		pool.close()
+	finally:
+		pool.terminate()
+		pool.join()
@@ -2,157 +2,171 @@ import matplotlib.pyplot as plt
 import seaborn as sns 
 import numpy as np 
 import pandas as pd 
-import copy
 
-def am_gen(data_df,b1,b2):
+from kn_tools.basic_tools import ucsc_exon_arrays
+
+def am_gen(data_df,b1,b2,exons=None):
     """Generates the geometric mean of the proportion of the window exons take up for a given dataframe (which should represent one plot)
     
     Parameters:
         data_df: (Pandas DataFrame) The DataFrame created using basic_tools text_to_df for the UCSC data, has a 'name2' column
+        b1: (int) Left edge of the window
+        b2: (int) Right edge of the window
+        exons: (dict) The ucsc_exon_arrays of data_df, parsed here if not given [Optional]
     """
-    total = 0
-    ex_count = 0
-    
-    for index,row in data_df.iterrows():
-        s = row.get_value('exonStarts')[:-1].split(',')
-        s = sorted(map(int,s))
-        e = row.get_value('exonEnds')[:-1].split(',')
-        e = sorted(map(int,e))
-        
-        for i in range(len(s)):
-            exlen = e[i] - s[i]
-            if exlen > 0:
-                total += float(abs(e[i]-s[i]))/(abs(b2-b1))
-                ex_count += 1
-                
-    return float(total)/ex_count
+    if exons == None:
+        exons = ucsc_exon_arrays(data_df)
+    rows = np.repeat(np.arange(len(data_df)),np.diff(exons['offsets']))
+    #starts and ends are paired after sorting each within its transcript
+    s = exons['starts'][np.lexsort((exons['starts'],rows))]
+    e = exons['ends'][np.lexsort((exons['ends'],rows))]
+    exlen = e - s
+    exlen = exlen[exlen > 0]
+    return float(exlen.sum())/abs(b2 - b1)/len(exlen)
+
+def seg_points(offsets,nodes,first,lo,hi,last):
+    """Builds one segment of every transcript at once, the sorted unique points first, the nodes between lo and hi, and last
+
+    Parameters:
+        offsets: (numpy array of int) Nodes of transcript k are nodes[offsets[k]:offsets[k+1]]
+        nodes: (numpy array of int) The exon starts and ends of every transcript
+        first: (numpy array of int) First point of each transcript's segment
+        lo: (numpy array of int) Lowest node kept for each transcript
+        hi: (numpy array of int) Highest node kept for each transcript
+        last: (numpy array of int) Last point of each transcript's segment
+
+    Returns:
+        seg: (dict) 'offsets' and 'points' int64 numpy arrays, points of transcript k are points[offsets[k]:offsets[k+1]]
+    """
+    n = len(first)
+    rows = np.repeat(np.arange(n),np.diff(offsets))
+    keep = (nodes >= lo[rows]) & (nodes <= hi[rows])
+    r = np.concatenate([np.arange(n),rows[keep],np.arange(n)])
+    v = np.concatenate([first,nodes[keep],last])
+    order = np.lexsort((v,r))
+    r = r[order]
+    v = v[order]
+    new = np.ones(len(v),dtype=bool)
+    new[1:] = (r[1:] != r[:-1]) | (v[1:] != v[:-1])
+    seg_offsets = np.zeros(n + 1,dtype=np.int64)
+    np.cumsum(np.bincount(r[new],minlength=n),out=seg_offsets[1:])
+    return {'offsets': seg_offsets,'points': v[new]}
+
+def get_segs(tx,cds,exons):
+    """Splits every transcript into its 3 plottable segments, 1 is before the cdsStart, 2 is between cdsStart and cdsEnd, 3 is past cdsEnd
 
-def scale(df):
-    """Takes in a dataframe of ucsc info to be plotted, and creates the plottable segments without augmentation, returns the plottable dataframe
+    Parameters:
+        tx: (numpy array of int) n by 2 txStart and txEnd
+        cds: (numpy array of int) n by 2 cdsStart and cdsEnd
+        exons: (dict) 'offsets', 'starts' and 'ends' as from ucsc_exon_arrays
+
+    Returns:
+        segs: (dict) 'tx', 'cds', the exon arrays and 's1', 's2', 's3' from seg_points
+    """
+    n = len(tx)
+    offsets = exons['offsets']
+    rows = np.repeat(np.arange(n),np.diff(offsets))
+    #both ends of every exon, grouped by transcript
+    order = np.argsort(np.concatenate([rows,rows]),kind='mergesort')
+    nodes = np.concatenate([exons['starts'],exons['ends']])[order]
+    node_offsets = 2*offsets
+    low = np.full(n,np.iinfo(np.int64).min,dtype=np.int64)
+    high = np.full(n,np.iinfo(np.int64).max,dtype=np.int64)
+
+    segs = {'tx': tx,'cds': cds,'offsets': offsets,'starts': exons['starts'],'ends': exons['ends']}
+    segs['s1'] = seg_points(node_offsets,nodes,tx[:,0],low,cds[:,0],cds[:,0])
+    segs['s2'] = seg_points(node_offsets,nodes,cds[:,0],cds[:,0],cds[:,1],cds[:,1])
+    segs['s3'] = seg_points(node_offsets,nodes,cds[:,1],cds[:,1],high,tx[:,1])
+    return segs
+
+def scale(df,exons=None):
+    """Takes in a dataframe of ucsc info to be plotted, and creates the plottable segments without augmentation, returns the segments as arrays
 
     Parameters:
         df: (Pandas DataFrame) The DataFrame created by the filter on the UCSC data_df, has one bin, one strand direction, and one rna attributed to it
+        exons: (dict) The ucsc_exon_arrays of df, parsed here if not given [Optional]
+
+    Returns:
+        segs: (dict) The segments from get_segs
     """
-    df = copy.deepcopy(df)
-    segs = []
-    
-    if not 's1' in list(df.columns):
-        df.insert(len(df.columns),'s1',0)
-    if not 's2' in list(df.columns):
-        df.insert(len(df.columns),'s2',0)
-    if not 's3' in list(df.columns):
-        df.insert(len(df.columns),'s3',0)
-    for index,row in df.iterrows():
-        s = map(int,list(row.get_value('exonStarts')[:-1].split(',')))
-        e = map(int,list(row.get_value('exonEnds')[:-1].split(',')))
-        tx = map(int,[row.get_value('txStart'),row.get_value('txEnd')])
-        cds = map(int,[row.get_value('cdsStart'),row.get_value('cdsEnd')])
-        
-        nodes = sorted(s+e)
-        
-        seg1 = sorted(list(set([tx[0]] + [pt for pt in nodes if pt <= cds[0]] + [cds[0]])))
-        seg2 = sorted(list(set([cds[0]] + [pt for pt in nodes if pt >= cds[0] and pt <= cds[1]] + [cds[1]])))
-        seg3 = sorted(list(set([cds[1]] + [pt for pt in nodes if pt >= cds[1]] + [tx[1]])))
-        
-        df.loc[index,'s1'] = ','.join(map(str,seg1))
-        df.loc[index,'s2'] = ','.join(map(str,seg2))
-        df.loc[index,'s3'] = ','.join(map(str,seg3))
-    return df
-
-def augment(df,am):
-    """Takes in a dataframe of ucsc info to be plotted, and creates the plottable segments with augmentation, returns the plottable dataframe
+    if exons == None:
+        exons = ucsc_exon_arrays(df)
+    tx = df[['txStart','txEnd']].values.astype(np.int64)
+    cds = df[['cdsStart','cdsEnd']].values.astype(np.int64)
+    return get_segs(tx,cds,exons)
+
+def augment(df,am,exons=None):
+    """Takes in a dataframe of ucsc info to be plotted, and creates the plottable segments with augmentation, returns the segments as arrays
 
     Parameters:
         df: (Pandas DataFrame) The DataFrame created by the filter on the UCSC data_df, has one bin, one strand direction, and one rna attributed to it
         am: (float) The arithmetic mean generated by am_gen function, must be below 0.02 to be useful, used as the index to scale up exons
+        exons: (dict) The ucsc_exon_arrays of df, parsed here if not given [Optional]
+
+    Returns:
+        segs: (dict) The segments from get_segs, with the scaled up exons and the tx starts/ends widened to fit them
     """
-    df = copy.deepcopy(df)
-    segs = []
+    if exons == None:
+        exons = ucsc_exon_arrays(df)
+    tx = df[['txStart','txEnd']].values.astype(np.int64)
+    cds = df[['cdsStart','cdsEnd']].values.astype(np.int64)
+    offsets = exons['offsets']
+    rows = np.repeat(np.arange(len(df)),np.diff(offsets))
+    
+    #Scaling up the exons around their middles
+    scale = 0.02/am
+    s_i = exons['starts']
+    e_i = exons['ends']
+    m = (s_i + e_i)/2.0
+    s_f = np.trunc(m - scale*(e_i - m) - 0.5).astype(np.int64)
+    e_f = np.trunc(m + scale*(e_i - m) + 0.5).astype(np.int64)
+    
+    #Making sure the tx starts/ends are adjusted if they have also been augmented
+    np.minimum.at(tx[:,0],rows,s_f)
+    np.maximum.at(tx[:,1],rows,e_f)
     
-    if not 's1' in list(df.columns):
-        df.insert(len(df.columns),'s1',0)
-    if not 's2' in list(df.columns):
-        df.insert(len(df.columns),'s2',0)
-    if not 's3' in list(df.columns):
-        df.insert(len(df.columns),'s3',0)
-    for index,row in df.iterrows():
-        s = map(int,list(row.get_value('exonStarts')[:-1].split(',')))
-        e = map(int,list(row.get_value('exonEnds')[:-1].split(',')))
-        tx = map(int,[row.get_value('txStart'),row.get_value('txEnd')])
-        cds = map(int,[row.get_value('cdsStart'),row.get_value('cdsEnd')])
-        
-        exons = []
-        for i in range(len(s)):
-            exons.append([s[i],e[i]])
-        #Take the median of each exon and length
-        
-        scale = 0.02/am
-        aug_ex = []
-        aug_s = []
-        aug_e = []
-        for exon in exons:
-            #Scaling up the exons
-            s_i = exon[0]
-            e_i = exon[1]
-            
-            m = (s_i + e_i)/2.0
-            s_f = m - scale*(e_i - m)
-            e_f = m + scale*(e_i - m)
-            
-            s_f = int(s_f - 0.5)
-            e_f = int(e_f + 0.5)
-            #Making sure the tx starts/ends are adjusted if they have also been augmented
-            if s_f < tx[0]:
-                tx[0] = s_f
-            #if s_f < cds[0]:
-                #m_i = (s_i + e_i)/2.0
-                #m_f = (s_f + e_f)/2.0
-                #cds[0] = m_f - scale*(m_i - cds[0])
-            if e_f > tx[1]:
-                tx[1] = e_f
-            #if e_f > cds[1]:
-                #m_i = (s_i + e_i)/2.0
-                #m_f = (s_f + e_f)/2.0
-                #cds[1] = m_f + scale*(abs(cds[1] - m_i))
-            aug_ex.append([s_f,e_f])
-            aug_s.append(s_f)
-            aug_e.append(e_f)
-            
-        aug_nodes = sorted(aug_s+aug_e)
-        seg1 = sorted(list(set([tx[0]] + [pt for pt in aug_nodes if pt <= cds[0]] + [cds[0]])))
-        seg2 = sorted(list(set([cds[0]] + [pt for pt in aug_nodes if pt >= cds[0] and pt <= cds[1]] + [cds[1]])))
-        seg3 = sorted(list(set([cds[1]] + [pt for pt in aug_nodes if pt >= cds[1]] + [tx[1]])))
-        
-        #rewrite info in dataframe to augmented data
-        df.loc[index,'exonStarts'] = ','.join(map(str,sorted(aug_s))) + ','
-        df.loc[index,'exonEnds'] = ','.join(map(str,sorted(aug_e))) + ','
-        df.loc[index,'txStart'] = tx[0]
-        df.loc[index,'txEnd'] = tx[1]
-        df.loc[index,'cdsStart'] = cds[0]
-        df.loc[index,'cdsEnd'] = cds[1]
-        
-        #add in the segment data
-        df.loc[index,'s1'] = ','.join(map(str,seg1))
-        df.loc[index,'s2'] = ','.join(map(str,seg2))
-        df.loc[index,'s3'] = ','.join(map(str,seg3))
-    return df
+    aug = {'offsets': offsets,
+           'starts': s_f[np.lexsort((s_f,rows))],
+           'ends': e_f[np.lexsort((e_f,rows))]}
+    return get_segs(tx,cds,aug)
 
 def plot_seg(ax,r,seg,exons,c,w):
-    """Plots the exons on a single segment of the rna, each rna has 3 segments: 1 is before the cdsStart, 2 is between cdsStart and cdsEnd, 3 is past cdsEnd
+    """Plots the exons on a single segment of every rna with one hlines call, each rna has 3 segments: 1 is before the cdsStart, 2 is between cdsStart and cdsEnd, 3 is past cdsEnd
 
     Parameters:
         ax: (Matplotlib Axis) The axis to plot the seg onto
-        r: (int) The y value to plot the seg onto
-        seg: (list) The list of exon start and ends to plot
-        exons: (list of lists) The list of exons for ex_i, the list has an element [s_i,e_i]
+        r: (numpy array) The y value to plot each rna's seg onto
+        seg: (dict) 'offsets' and 'points' of the seg, from seg_points
+        exons: (dict) 'offsets', 'starts' and 'ends' of the exons of each rna
         c: (str) Valid matplotlib color to plot, for seg 2's it should be Crimson, for seg 1 and 3's it should be #8c0d26
         w: (float) The width of the line, for seg 2's it should be 20, for seg 1 and 3's it should be 10
     """
-    for i in range(len(seg)-1):
-        for exon in exons:
-            if seg[i] >= exon[0] and seg[i+1] <= exon[1]:
-                ax.hlines(r,seg[i],seg[i+1],colors=c,linewidth=w)
-                pass
+    n = len(seg['offsets']) - 1
+    rows = np.repeat(np.arange(n),np.diff(seg['offsets']))
+    pts = seg['points']
+    #consecutive points of the same rna
+    pair = np.flatnonzero(rows[1:] == rows[:-1])
+    prow = rows[pair]
+    a = pts[pair]
+    b = pts[pair + 1]
+    
+    erows = np.repeat(np.arange(n),np.diff(exons['offsets']))
+    if len(pair) == 0 or len(erows) == 0:
+        return
+    
+    #a piece is drawn if some exon of its rna starts at or before a and ends at or after b,
+    #so look up the furthest end of the exons starting at or before a, keyed by rna then position
+    order = np.lexsort((exons['starts'],erows))
+    erows = erows[order]
+    lo = min(exons['starts'].min(),a.min())
+    span = max(exons['ends'].max(),b.max()) - lo + 1
+    start_keys = erows*span + (exons['starts'][order] - lo)
+    furthest = np.maximum.accumulate(erows*span + (exons['ends'][order] - lo)) - erows*span + lo
+    
+    found = np.searchsorted(start_keys,prow*span + (a - lo),side='right') - 1
+    ok = (found >= 0) & (erows[found] == prow) & (furthest[found] >= b)
+    if ok.any():
+        ax.hlines(np.asarray(r)[prow[ok]],a[ok],b[ok],colors=c,linewidth=w)
 
 def ucsc_plot(rna,data,fname=None,override=False,excd='Crimson',extx='#8c0d26',incd='#ffbab3',intx='MistyRose'):
     """Produces all the plot for the UCSC data of a single rna, separates plots by bin and strand, augments if am is below 0.02
@@ -169,8 +183,7 @@ def ucsc_plot(rna,data,fname=None,override=False,excd='Crimson',extx='#8c0d26',i
     """
     str_aug = ''
     sns.set_style('whitegrid')
-    temp_df = copy.deepcopy(data)
-    temp_df = temp_df[temp_df['name2'] == rna]
+    temp_df = data[data['name2'] == rna]
     
     strands = list(set(temp_df['strand']))
     for strand in strands:
@@ -181,42 +194,28 @@ def ucsc_plot(rna,data,fname=None,override=False,excd='Crimson',extx='#8c0d26',i
             try:
                 fig,ax = plt.subplots()
 
-                b1 = min(map(int,list(bin_df['txStart']))) - 100
-                b2 = max(map(int,list(bin_df['txEnd']))) + 100
+                b1 = bin_df['txStart'].astype(np.int64).min() - 100
+                b2 = bin_df['txEnd'].astype(np.int64).max() + 100
 
-                am = am_gen(bin_df,b1,b2)
+                exons = ucsc_exon_arrays(bin_df)
+                am = am_gen(bin_df,b1,b2,exons)
 
                 if am > 0.02 or override:
-                    plot_df = scale(bin_df)
+                    segs = scale(bin_df,exons)
                 else:
-                    plot_df = augment(bin_df,am)
+                    segs = augment(bin_df,am,exons)
                     str_aug = 'augmented'
-                    b1 = min(map(int,list(plot_df['txStart']))) - 100
-                    b2 = max(map(int,list(plot_df['txEnd']))) + 100
-                r = 0
-                for index,row in plot_df.iterrows():
-                    s = map(float,list(row.get_value('exonStarts')[:-1].split(',')))
-                    e = map(float,list(row.get_value('exonEnds')[:-1].split(',')))
-                    tx = map(float,[row.get_value('txStart'),row.get_value('txEnd')])
-                    cds = map(float,[row.get_value('cdsStart'),row.get_value('cdsEnd')])
-                    nodes = sorted(s+e)
-                    exons = []
-                    for i in range(len(s)):
-                        exons.append([s[i],e[i]])
-
-                    seg1 = map(float,row.get_value('s1').split(','))
-                    seg2 = map(float,row.get_value('s2').split(','))
-                    seg3 = map(float,row.get_value('s3').split(','))
-
-                    ax.hlines(r,tx[0],tx[1],colors=intx,linewidth=10)
-                    ax.hlines(r,cds[0],cds[1],colors=incd,linewidth=10)
-                    plot_seg(ax,r,seg1,exons,extx,10)
-                    plot_seg(ax,r,seg3,exons,extx,10)
-
-                    plot_seg(ax,r,seg2,exons,excd,20)
-                    r += 1
-
-                if row.get_value('strand') == '+':
+                    b1 = segs['tx'][:,0].min() - 100
+                    b2 = segs['tx'][:,1].max() + 100
+                r = np.arange(len(bin_df))
+                
+                ax.hlines(r,segs['tx'][:,0],segs['tx'][:,1],colors=intx,linewidth=10)
+                ax.hlines(r,segs['cds'][:,0],segs['cds'][:,1],colors=incd,linewidth=10)
+                plot_seg(ax,r,segs['s1'],segs,extx,10)
+                plot_seg(ax,r,segs['s3'],segs,extx,10)
+                plot_seg(ax,r,segs['s2'],segs,excd,20)
+
+                if strand == '+':
                     lb = b1 - 100
                     rb = b2 + 100
                 else:
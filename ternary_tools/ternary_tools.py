@@ -1,46 +1,75 @@
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 import matplotlib.cm as cmx
+from matplotlib.collections import PolyCollection,LineCollection
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import multiprocessing as mp
+import os
+import time
 import math
 import copy
+import numpy as np
 
-def get_mag(x_vals,y_vals):
-    """Gets the magnitude of a vector
+def get_deltas(x_vals,y_vals=None):
+    """Gets the x and y change of one vector or a batch of vectors
     
     Parameters:
-        x_vals: (list) [x_0,x_1]
-        y_vals: (list) [y_0,y_1]
+        x_vals: (list or numpy array) [x_0,x_1], an n by 2 array of x pairs or an n by 2 by 2 array of [[x_0,x_1],[y_0,y_1]] vectors
+        y_vals: (list or numpy array) [y_0,y_1] or an n by 2 array of y pairs, left out for an n by 2 by 2 batch [Optional]
+
+    Returns:
+        dx: (numpy array of float) Change in x of each vector
+        dy: (numpy array of float) Change in y of each vector
     """
-    dx = x_vals[1] - x_vals[0]
-    dy = y_vals[1] - y_vals[0]
-    mag = (dx**2 + dy**2)**0.5
-    return mag
+    if y_vals is None:
+        v = np.asarray(x_vals,dtype=np.float64)
+        x_vals = v[...,0,:]
+        y_vals = v[...,1,:]
+    x_vals = np.asarray(x_vals,dtype=np.float64)
+    y_vals = np.asarray(y_vals,dtype=np.float64)
+    return x_vals[...,1] - x_vals[...,0],y_vals[...,1] - y_vals[...,0]
 
-def get_angle(x_vals,y_vals):
-    """Gets the degree angle of a vector
+def get_mag(x_vals,y_vals=None):
+    """Gets the magnitude of a vector or of every vector in a batch
     
     Parameters:
-        x_vals: (list) [x_0,x_1]
-        y_vals: (list) [y_0,y_1]
+        x_vals: (list or numpy array) [x_0,x_1], n by 2 x pairs or an n by 2 by 2 batch as in get_deltas
+        y_vals: (list or numpy array) [y_0,y_1] or n by 2 y pairs [Optional]
     """
-    dx = x_vals[1] - x_vals[0]
-    dy = y_vals[1] - y_vals[0]
-    if dx == 0:
-        if dy > 0:
-            return 90
-        else:
-            return 270
-    a = math.atan(dy/dx)*180/math.pi
+    dx,dy = get_deltas(x_vals,y_vals)
+    return np.hypot(dx,dy)
+
+def get_angle(x_vals,y_vals=None):
+    """Gets the degree angle in [0,360) of a vector or of every vector in a batch, a vector that does not move is given 270
     
-    if dx > 0 and dy > 0:
-        return a
-    if dx < 0 and dy > 0:
-        return 180 + a
-    if dx < 0 and dy < 0:
-        return 180 + a
-    return 360 + a
+    Parameters:
+        x_vals: (list or numpy array) [x_0,x_1], n by 2 x pairs or an n by 2 by 2 batch as in get_deltas
+        y_vals: (list or numpy array) [y_0,y_1] or n by 2 y pairs [Optional]
+    """
+    dx,dy = get_deltas(x_vals,y_vals)
+    a = np.degrees(np.arctan2(dy,dx)) % 360
+    return np.where((dx == 0) & (dy == 0),270.0,a)[()]
+
 
+TERNARY_VERTICES = np.array([[0,1],
+                             [((3**0.5)/2),-0.5],
+                             [(-(3**0.5)/2),-0.5]])
 
+def get_barycentric(info_df,top_col,left_col,right_col):
+    """Gets the normalised barycentric coordinates of every row and whether each row can be projected (its smallest value is not 0)
+    
+    Parameters:
+        info_df: (Pandas Dataframe) has columns for the vertices of ternary
+        top_col: (str) Name of top vertex
+        left_col: (str) Name of left vertex
+        right_col: (str) Name of right vertex
+    """
+    tlr = info_df[[top_col,left_col,right_col]].values.astype(np.float64)
+    ok = tlr.min(axis=1) != 0
+    with np.errstate(divide='ignore',invalid='ignore'):
+        tlr = tlr/tlr.sum(axis=1)[:,None]
+    return tlr,ok
 
 def get_points(info_df,top_col,left_col,right_col):
     """Gets the euclidean coordinates of the ternary plot points along with the ordered gene names
@@ -51,38 +80,105 @@ def get_points(info_df,top_col,left_col,right_col):
         left_col: (str) Name of left vertex
         right_col: (str) Name of right vertex
     """
-    #up
-    top = [0,1]
-    #right
-    left = [((3**0.5)/2),-0.5]
-    #left
-    right = [(-(3**0.5)/2),-0.5]
-    
-    points = []
-    genes = []
-    for index,row in info_df.iterrows():
-        t = float(row.get_value(top_col))
-        l = float(row.get_value(left_col))
-        r = float(row.get_value(right_col))
-        total = t + l + r
-
-        if min(t,l,r) != 0:
-            t /= total
-            l /= total
-            r /= total
-            row_sum = [top[0]*t + left[0]*l + right[0]*r,
-                       top[1]*t + left[1]*l + right[1]*r]
-            if row_sum[1] > -0.5:
-                if row_sum[1] < (3**0.5)*row_sum[0] + 1:
-                    if row_sum[1] < -(3**0.5)*row_sum[0] + 1:
-                        points.append(row_sum)
-                        genes.append(index)
-            
-    all_x = [item[0] for item in points]
-    all_y = [item[1] for item in points]
-    return [all_x,all_y],genes
-
-def plot_ternary(data_specs,title,fig=None,ax=None,t_scale=1,location=None,t=r'Membrane',l=r'Insoluble',r=r'Cytosolic'):
+    tlr,ok = get_barycentric(info_df,top_col,left_col,right_col)
+    xy = tlr.dot(TERNARY_VERTICES)
+    x = xy[:,0]
+    y = xy[:,1]
+    with np.errstate(invalid='ignore'):
+        inside = (y > -0.5) & (y < (3**0.5)*x + 1) & (y < -(3**0.5)*x + 1)
+    keep = ok & inside
+    genes = list(info_df.index[keep])
+    return np.array([x[keep],y[keep]]),genes
+
+def get_tri_density(data,n=50):
+    """Bins ternary points into a grid of n*n small triangles over the simplex with NumPy histogramming
+
+    Parameters:
+        data: (numpy array) [all_x,all_y] from get_points
+        n: (int) Number of triangles along each side [Optional]
+
+    Returns:
+        polys: (numpy array of float) cells by 3 by 2 corners of the non empty triangles
+        counts: (numpy array of int) The number of points in each of those triangles
+    """
+    x = np.asarray(data[0],dtype=np.float64)
+    y = np.asarray(data[1],dtype=np.float64)
+    #back to the top and left barycentric coordinates
+    top = (y + 0.5)/1.5
+    left = (1 - top + 2*x/(3**0.5))/2
+    a = np.clip(top*n,0,n - 1e-9)
+    b = np.clip(left*n,0,n - 1e-9)
+    i = np.floor(a).astype(np.int64)
+    j = np.floor(b).astype(np.int64)
+    down = ((a - i) + (b - j) >= 1) & (i + j < n - 1)
+    j = np.minimum(j,n - 1 - i)
+
+    cells = np.bincount((i*n + j)*2 + down,minlength=2*n*n)
+    found = np.flatnonzero(cells)
+    ci = found//2//n
+    cj = found//2 % n
+    cd = found % 2
+
+    #corners in (top, left) grid units, an up triangle (i,j),(i+1,j),(i,j+1) and a down one (i+1,j),(i,j+1),(i+1,j+1)
+    ti = np.stack([ci + cd,ci + 1,ci],axis=1)
+    lj = np.stack([cj + cd,cj,cj + 1],axis=1)
+    tlr = np.stack([ti/float(n),lj/float(n),1 - (ti + lj)/float(n)],axis=2)
+    polys = tlr.dot(TERNARY_VERTICES)
+    return polys,cells[found]
+
+def draw_ternary_frame(ax,t_scale=1,t=r'Membrane',l=r'Insoluble',r=r'Cytosolic',wheel=False,cmap='hsv',spec_lab='Angle Spectrum'):
+    """Draws the static parts of a ternary plot, the triangle, vertex titles and for dynamic plots the angle colour wheel
+
+    Parameters:
+        ax: (Matplotlib Axis) Axis to draw on
+        t_scale: (float) Text scale up or down [Optional]
+        t: (str) Title of the top vertex [Optional]
+        l: (str) Title of the left vertex [Optional]
+        r: (str) Title of the right vertex [Optional]
+        wheel: (bool) Whether to use the plot_dyn_ternary layout with its angle colour wheel [Optional]
+        cmap: (str) Matplotlib colormap of the wheel [Optional]
+        spec_lab: (str) Label for the angle spectrum [Optional]
+    """
+    #triangle
+    lw = 2 if wheel else 2*t_scale
+    ax.plot([((3**0.5)/2),0],[-0.5,1],c='black',linewidth=lw)
+    ax.plot([(-(3**0.5)/2),0],[-0.5,1],c='black',linewidth=lw)
+    ax.plot([((3**0.5)/2),(-(3**0.5)/2)],[-0.5,-0.5],c='black',linewidth=lw)
+    set_ternary_limits(ax,wheel)
+
+    #labels
+    ax.text(0,1.05,t,fontsize=28*t_scale,weight='demi',horizontalalignment='center')
+    ax.text((3**0.5)/2,-0.6,l,fontsize=28*t_scale,weight='demi',horizontalalignment='center')
+    ax.text(-(3**0.5)/2,-0.6,r,fontsize=28*t_scale,weight='demi',horizontalalignment='center')
+
+    if wheel:
+        scalarMap = cmx.ScalarMappable(norm=colors.Normalize(vmin=0,vmax=360),cmap=plt.get_cmap(cmap))
+        ax.text(0.9,0.48,spec_lab,fontsize=20*t_scale,weight='demi',horizontalalignment='center')
+        a = np.radians(np.arange(0,360,3))
+        x = np.cos(a)
+        y = np.sin(a)
+        segs = np.stack([np.stack([x/12 + 0.9,y/12 + 0.23],axis=1),np.stack([x/6 + 0.9,y/6 + 0.23],axis=1)],axis=1)
+        colorVals = scalarMap.to_rgba(np.arange(0,360,3))
+        colorVals[:,:3] *= 0.9
+        ax.add_collection(LineCollection(segs,colors=colorVals,linewidths=plt.rcParams['lines.linewidth'],capstyle='projecting'))
+
+def set_ternary_limits(ax,wheel=False):
+    """Sets the axis limits of a ternary plot and hides the axes
+
+    Parameters:
+        ax: (Matplotlib Axis) Axis to set
+        wheel: (bool) Whether to use the plot_dyn_ternary limits [Optional]
+    """
+    ax.grid(b=False)
+    ax.axis('off')
+    if wheel:
+        ax.set_xlim([(-(3**0.5)/2)-0.2,((3**0.5)/2)+0.25])
+        ax.set_ylim([-0.5-0.2,1+0.2])
+    else:
+        ax.set_xlim([(-(3**0.5)/2)-0.25,((3**0.5)/2)+0.25])
+        ax.set_ylim([-0.5-0.25,1+0.25])
+
+def plot_ternary(data_specs,title,fig=None,ax=None,t_scale=1,location=None,t=r'Membrane',l=r'Insoluble',r=r'Cytosolic',mode='auto',threshold=100000,gridsize=50):
     """Plots a ternary plot
 
     Parameters:
@@ -95,17 +191,37 @@ def plot_ternary(data_specs,title,fig=None,ax=None,t_scale=1,location=None,t=r'M
         t: (str) Title of the top vertex [Optional]
         l: (str) Title of the left vertex [Optional]
         r: (str) Title of the right vertex [Optional]
+        mode: (str) 'scatter' for one marker per point, 'density' for get_tri_density triangles, 'auto' picks density above threshold points [Optional]
+        threshold: (int) Number of points above which 'auto' draws densities [Optional]
+        gridsize: (int) Number of density triangles along each side [Optional]
+
+    Returns:
+        stats: (dictionary) 'mode' used, 'points' drawn, 'seconds' to draw and save, 'bytes' of the saved file or None
     """
+    start = time.time()
     if fig == None and ax == None:
         fig,ax = plt.subplots(figsize=(14,7*(3**0.5)))
     numbers = ''
     
+    points = sum(len(spec['Data'][0]) for spec in data_specs if spec['Label'] != None)
+    if mode == 'auto':
+        mode = 'density' if points > threshold else 'scatter'
+    
     for spec in data_specs:
         data = spec['Data']
         color = spec['Color']
         label = spec['Label']
         
-        if label != None:
+        if label != None and mode == 'density':
+            polys,counts = get_tri_density(data,gridsize)
+            cmap = colors.LinearSegmentedColormap.from_list(label,[colors.to_rgba(color,0.1),colors.to_rgba(color,1)])
+            ax.add_collection(PolyCollection(polys,array=np.log1p(counts),cmap=cmap,edgecolors='none'))
+            ax.plot([],[],
+                    marker='s',
+                    c=color,
+                    linestyle='None',
+                    label=label + ' (' + str(len(data[0])) + ' points)')
+        elif label != None:
             ax.plot(data[0],
                     data[1],
                     marker='.',
@@ -114,40 +230,40 @@ def plot_ternary(data_specs,title,fig=None,ax=None,t_scale=1,location=None,t=r'M
                     linestyle='None',
                     label=label + ' (' + str(len(data[0])) + ' points)')
         
-    #triangle
-    ax.plot([((3**0.5)/2),0],[-0.5,1],c='black',linewidth=2*t_scale)
-    ax.plot([(-(3**0.5)/2),0],[-0.5,1],c='black',linewidth=2*t_scale)
-    ax.plot([((3**0.5)/2),(-(3**0.5)/2)],[-0.5,-0.5],c='black',linewidth=2*t_scale)
-    ax.grid(b=False)
-    ax.axis('off')
-    ax.set_xlim([(-(3**0.5)/2)-0.25,((3**0.5)/2)+0.25])
-    ax.set_ylim([-0.5-0.25,1+0.25])
-
-    #labels
-    ax.text(0,1.05,t,fontsize=28*t_scale,weight='demi',horizontalalignment='center')
-    ax.text((3**0.5)/2,-0.6,l,fontsize=28*t_scale,weight='demi',horizontalalignment='center')
-    ax.text(-(3**0.5)/2,-0.6,r,fontsize=28*t_scale,weight='demi',horizontalalignment='center')
+    draw_ternary_frame(ax,t_scale,t,l,r)
     
     legend = ax.legend(fontsize=17*t_scale,loc=2,frameon=True)
     frame = legend.get_frame()
     frame.set_edgecolor('black')
 
     ax.set_title(title,fontsize=40*t_scale,weight='bold')
+    size = None
     if location != None:
         fig.savefig(location)
+        size = os.path.getsize(location)
+    return {'mode': mode,'points': points,'seconds': time.time() - start,'bytes': size}
 
 def alter_length(x_vals,y_vals,p):
-    """Changes the length of the vector for a given proportion
+    """Changes the length of a vector or of every vector in a batch for a given proportion
 
     Parameters:
-        x_vals = (list) [x_0,x_1]
-        y_vals = (list) [y_0,y_1[
-        p = (float) proportion ex: 10 becomes a tenth of length"""
-    dx = float(x_vals[1] - x_vals[0])
-    dy = float(y_vals[1] - y_vals[0])
-    
-    new_xs = [x_vals[0],x_vals[0] + dx/float(p)]
-    new_ys = [y_vals[0],y_vals[0] + dy/float(p)]
+        x_vals: (list or numpy array) [x_0,x_1], n by 2 x pairs or an n by 2 by 2 batch as in get_deltas
+        y_vals: (list or numpy array) [y_0,y_1] or n by 2 y pairs, None for a batch
+        p: (float) proportion ex: 10 becomes a tenth of length
+
+    Returns:
+        vectors: (list or numpy array) [new_xs,new_ys], or an n by 2 by 2 batch when given one
+    """
+    dx,dy = get_deltas(x_vals,y_vals)
+    if y_vals is None:
+        v = np.array(x_vals,dtype=np.float64)
+        v[...,0,1] = v[...,0,0] + dx/float(p)
+        v[...,1,1] = v[...,1,0] + dy/float(p)
+        return v
+    x0 = np.asarray(x_vals,dtype=np.float64)[...,0]
+    y0 = np.asarray(y_vals,dtype=np.float64)[...,0]
+    new_xs = np.stack([x0,x0 + dx/float(p)],axis=-1)
+    new_ys = np.stack([y0,y0 + dy/float(p)],axis=-1)
     return [new_xs,new_ys]
 
 def get_points_dyn(info_df,head,tail,t_suff='_mem',l_suff='_ins',r_suff='_cyt'):
@@ -161,40 +277,15 @@ def get_points_dyn(info_df,head,tail,t_suff='_mem',l_suff='_ins',r_suff='_cyt'):
         l_suff: (str) Suffix of the column in info_df for left vertex data [Optional]
         r_suff: (str) Suffix of the column in info_df for right vertex data [Optional]
     """
-    #up
-    top = [0,1]
-    #right
-    left = [((3**0.5)/2),-0.5]
-    #left
-    right = [(-(3**0.5)/2),-0.5]
-    
-    points = []
-    genes = []
-    for index,row in info_df.iterrows():
-        xyxy = []
-        for p in [head,tail]:
-            top_col = p + t_suff
-            left_col = p + l_suff
-            right_col = p + r_suff
-            
-            t = float(row.get_value(top_col))
-            l = float(row.get_value(left_col))
-            r = float(row.get_value(right_col))
-            total = t + l + r
-            if min(t,l,r) != 0:
-                t /= total
-                l /= total
-                r /= total
-                row_sum = [top[0]*t + left[0]*l + right[0]*r,
-                           top[1]*t + left[1]*l + right[1]*r]
-                xyxy.append(row_sum[0])
-                xyxy.append(row_sum[1])
-        if len(xyxy) == 4:
-            points.append(xyxy)
-            genes.append(index)
-    all_x = [[item[0],item[2]] for item in points]
-    all_y = [[item[1],item[3]] for item in points]
-    return [all_x,all_y]
+    xys = []
+    keep = np.ones(len(info_df),dtype=bool)
+    for p in [head,tail]:
+        tlr,ok = get_barycentric(info_df,p + t_suff,p + l_suff,p + r_suff)
+        xys.append(tlr.dot(TERNARY_VERTICES))
+        keep &= ok
+    all_x = np.stack([xys[0][keep,0],xys[1][keep,0]],axis=1)
+    all_y = np.stack([xys[0][keep,1],xys[1][keep,1]],axis=1)
+    return np.array([all_x,all_y])
 
 def plot_dyn_ternary(dyn_points,title,fig=None,ax=None,t_scale=1,cmap='hsv',location=None,t=r'Membrane',l=r'Insoluble',r=r'Cytosolic',spec_lab='Angle Spectrum'):
     """Plots a ternary plot
@@ -218,56 +309,101 @@ def plot_dyn_ternary(dyn_points,title,fig=None,ax=None,t_scale=1,cmap='hsv',loca
     
     if fig == None and ax == None:
         fig,ax = plt.subplots(figsize=(14,7*(3**0.5)))
-    for i in range(len(dyn_points[0])):
-        v = [dyn_points[0][i],dyn_points[1][i]]
-        x1 = v[0][0]
-        x2 = v[0][1]
-        y1 = v[1][0]
-        y2 = v[1][1]
-        angle = get_angle(v[0],v[1])
-        colorVal = scalarMap.to_rgba(angle)
-        temp = list(colorVal)
-        for i in range(3):
-            temp[i] *= 0.9
-        colorVal = list(temp)
-        if get_mag(v[0],v[1]) > 0.05:
-            v = alter_length([x1,x2],[y1,y2],15)
-            x1 = v[0][0]
-            x2 = v[0][1]
-            y1 = v[1][0]
-            y2 = v[1][1]
-            dx = x2 - x1
-            dy = y2 - y1
-            ax.arrow(x1,y1,dx,dy,color=colorVal,width=0.0005,length_includes_head=True)
-        else:
-            ax.plot(x1,y1,marker='.',c=colorVal,markeredgecolor=colorVal,markersize=6)
+    #n by 2 by 2 batch of [[x_0,x_1],[y_0,y_1]] vectors
+    v = np.asarray(dyn_points,dtype=np.float64).reshape(2,-1,2).transpose(1,0,2)
+    colorVals = scalarMap.to_rgba(get_angle(v))
+    colorVals[:,:3] *= 0.9
+    moving = get_mag(v) > 0.05
+    
+    #every arrow in one quiver, shortened to a fifteenth of its length
+    short = alter_length(v[moving],None,15)
+    dx,dy = get_deltas(short)
+    ax.quiver(short[:,0,0],short[:,1,0],dx,dy,color=colorVals[moving],
+              angles='xy',scale_units='xy',scale=1,units='xy',width=0.0005,
+              headwidth=3,headlength=4.5,headaxislength=4.5,
+              edgecolors=colorVals[moving],linewidths=1)
+    ax.scatter(v[~moving,0,0],v[~moving,1,0],s=36,marker='.',c=colorVals[~moving],edgecolors=colorVals[~moving])
 
-    #triangle
-    ax.plot([((3**0.5)/2),0],[-0.5,1],c='black',lw=2)
-    ax.plot([(-(3**0.5)/2),0],[-0.5,1],c='black',lw=2)
-    ax.plot([((3**0.5)/2),(-(3**0.5)/2)],[-0.5,-0.5],c='black',lw=2)
-    ax.grid(b=False)
-    ax.axis('off')
-    ax.set_xlim([(-(3**0.5)/2)-0.2,((3**0.5)/2)+0.25])
-    ax.set_ylim([-0.5-0.2,1+0.2])
+    draw_ternary_frame(ax,t_scale,t,l,r,True,cmap,spec_lab)
 
-    #labels
-    ax.text(0,1.05,t,fontsize=28*t_scale,weight='demi',horizontalalignment='center')
-    ax.text((3**0.5)/2,-0.6,l,fontsize=28*t_scale,weight='demi',horizontalalignment='center')
-    ax.text(-(3**0.5)/2,-0.6,r,fontsize=28*t_scale,weight='demi',horizontalalignment='center')
+    ax.set_title(title,fontsize=40*t_scale,weight='bold')
+    if location != None:
+        fig.savefig(location)
 
-    ax.text(0.9,0.48,spec_lab,fontsize=20*t_scale,weight='demi',horizontalalignment='center')
-    for i in range(0,360,3):
-        x = math.cos(math.radians(i))
-        y = math.sin(math.radians(i))
-        colorVal = scalarMap.to_rgba(i)
-        temp = list(colorVal)
-        for i in range(3):
-            temp[i] *= 0.9
-        colorVal = list(temp)
-        ax.plot((x/12 + 0.9,x/6 + 0.9),(y/12 + 0.23,y/6+0.23),color=colorVal)
 
-    ax.set_title(title,fontsize=40*t_scale,weight='bold')
+def plot_ternary_grid(panels,ncols=3,panel_size=(7,3.5*(3**0.5)),t_scale=0.5,dpi=100,location=None,t=r'Membrane',l=r'Insoluble',r=r'Cytosolic',cmap='hsv',spec_lab='Angle Spectrum'):
+    """Plots many plot_ternary and plot_dyn_ternary panels on one figure with an Agg canvas, so it can be drawn in any process without pyplot
+
+    Parameters:
+        panels: (list of dictionaries) Keys are 'Kind' ('ternary' or 'dyn'), 'Data' (data_specs for plot_ternary or points from get_points_dyn) and 'Title'
+        ncols: (int) Number of panels per row [Optional]
+        panel_size: (tuple of float) Width and height of each panel in inches [Optional]
+        t_scale: (float) Text scale up or down [Optional]
+        dpi: (float) Dots per inch of the figure [Optional]
+        location: (str) Where the figure should be saved, if it is to be saved [Optional]
+        t: (str) Title of the top vertex [Optional]
+        l: (str) Title of the left vertex [Optional]
+        r: (str) Title of the right vertex [Optional]
+        cmap: (str) Matplotlib colormap of the dynamic panels [Optional]
+        spec_lab: (str) Label for the angle spectrum [Optional]
+
+    Returns:
+        fig: (Matplotlib Figure) The figure
+    """
+    nrows = max(1,int(math.ceil(len(panels)/float(ncols))))
+    fig = Figure(figsize=(ncols*panel_size[0],nrows*panel_size[1]),dpi=dpi)
+    FigureCanvasAgg(fig)
+    for i,panel in enumerate(panels):
+        ax = fig.add_subplot(nrows,ncols,i + 1)
+        if panel['Kind'] == 'dyn':
+            plot_dyn_ternary(panel['Data'],panel['Title'],fig=fig,ax=ax,t_scale=t_scale,cmap=cmap,t=t,l=l,r=r,spec_lab=spec_lab)
+        else:
+            plot_ternary(panel['Data'],panel['Title'],fig=fig,ax=ax,t_scale=t_scale,t=t,l=l,r=r)
     if location != None:
         fig.savefig(location)
+    return fig
+
+def export_ternary_grid(job):
+    """Plots and saves one plot_ternary_grid figure, a worker for export_ternary_grids
+
+    Parameters:
+        job: (tuple) (panels,location,grid_args) where grid_args is a dictionary of plot_ternary_grid keyword arguments
+
+    Returns:
+        stats: (dictionary) 'location', number of 'panels', 'seconds' to plot and save and 'bytes' of the saved file
+    """
+    panels,location,grid_args = job
+    start = time.time()
+    plot_ternary_grid(panels,location=location,**grid_args)
+    return {'location': location,'panels': len(panels),'seconds': time.time() - start,'bytes': os.path.getsize(location)}
+
+def export_ternary_grids(jobs,processes=None,chunksize=1,debug=False):
+    """Plots and saves many plot_ternary_grid figures in worker processes, every figure is drawn on its own Agg canvas
+
+    Parameters:
+        jobs: (list of tuples) (panels,location,grid_args) for each figure as in export_ternary_grid
+        processes: (int) Number of worker processes, None for one per core and 1 to run in this process [Optional]
+        chunksize: (int) Number of figures handed to a worker at a time [Optional]
+        debug: (bool) Whether to print the timing of each figure as it finishes [Optional]
+
+    Returns:
+        stats: (list of dictionaries) export_ternary_grid stats of each figure in the order they finished
+    """
+    if processes == 1:
+        pool = None
+        results = (export_ternary_grid(job) for job in jobs)
+    else:
+        pool = mp.Pool(processes)
+        results = pool.imap_unordered(export_ternary_grid,jobs,chunksize)
 
+    stats = []
+    try:
+        for result in results:
+            if debug:
+                print result['location'] + ': ' + str(result['panels']) + ' panels in ' + str(round(result['seconds'],2)) + 's'
+            stats.append(result)
+    finally:
+        if pool != None:
+            pool.terminate()
+            pool.join()
+    return stats